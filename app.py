@@ -1,13 +1,27 @@
 #!/usr/bin/env python3
+import json
+import math
 import os
+import socket
 import threading
+from collections import namedtuple
 from time import sleep, time
-import sqlite3
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 
 from intellicart import Intellicart, utils
 from intellicart.music import Music
+from replicator import HttpSink, PostgresSink, Replicator
+from sparklines import (
+    DEFAULT_COLOR, METRIC_COLORS, SPARKLINE_HEIGHT, SPARKLINE_WIDTH, SparklineCache, render_svg,
+)
+from telemetry_buffer import TelemetryRing, dump_to_dir
+from telemetry_spool import Spool
+from telemetry_store import (
+    AGGREGATE_COLUMNS, TELEMETRY_COLUMNS, ReadPool, TelemetryMaintenance,
+    TelemetryWriter, align_bucket, fetch_history, fetch_history_buckets,
+    init_db, rows_to_columns,
+)
 
 try:
     from videolib import videolib
@@ -24,52 +38,115 @@ except Exception:
 
 # ===== SQLite setup =====
 DB_PATH = os.path.join(os.path.dirname(__file__), "telemetry.db")
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
-cur.execute("""
-CREATE TABLE IF NOT EXISTS telemetry (
-  ts REAL,
-  speed REAL,
-  raw_speed REAL,
-  distance REAL,
-  line_l INTEGER,
-  line_m INTEGER,
-  line_r INTEGER,
-  motion TEXT,
-  line_state TEXT,
-  obstacle INTEGER,
-  cpu_temp REAL,
-  line_track INTEGER,
-  avoid_obstacles INTEGER,
-  color_follow INTEGER,
-  color_detect INTEGER,
-  face_detect INTEGER
-)
-""")
-conn.commit()
+init_db(DB_PATH)
+
+# Flask request threads read through their own read-only connections
+read_pool = ReadPool(DB_PATH)
+
+# Rows are committed in batches by a background thread so an SD-card fsync
+# never stalls the 20 Hz control loop. "compact" stores each row as a few
+# small ints in telemetry_packed; "wide" keeps writing the original table.
+STORAGE_MODE = "compact"
+writer = TelemetryWriter(DB_PATH, compact=(STORAGE_MODE == "compact")).start()
 
 
 def log_telemetry_row(row):
-    """Insert one telemetry sample into SQLite."""
+    """Queue one telemetry sample for the SQLite writer (never blocks)."""
+    writer.submit(row)
+
+
+# Retention: raw 1 Hz rows, then per-minute rollups; hourly rollups are
+# kept forever. Maintenance rolls up, prunes and vacuums in the background.
+RAW_RETENTION_DAYS = 7
+MINUTE_RETENTION_DAYS = 90
+MAINTENANCE_INTERVAL = 300    # s
+maintenance = TelemetryMaintenance(
+    DB_PATH,
+    raw_retention=RAW_RETENTION_DAYS * 86400,
+    minute_retention=MINUTE_RETENTION_DAYS * 86400,
+    interval=MAINTENANCE_INTERVAL,
+).start()
+
+# ===== Central replication =====
+# Rows are shipped to vehicle_telemetry on the central side by a background
+# replicator that resumes from its last acknowledged ts after Wi-Fi drops.
+# CENTRAL_URL posts gzip-compressed batches to the central dashboard's
+# /api/ingest (preferred: no database credentials on the cart); PG_CONFIG
+# writes straight into the central PostgreSQL instead, using the same keys
+# as central_dashboard.PG_CONFIG. Both None keeps telemetry local only.
+# CENTRAL_TOKEN must match central_dashboard.INGEST_TOKEN.
+VEHICLE_ID = socket.gethostname()
+CENTRAL_URL = None
+# CENTRAL_URL = "http://<central-ip>:8000"
+CENTRAL_TOKEN = None
+PG_CONFIG = None
+# PG_CONFIG = {
+#     "host": "<central-ip>",
+#     "port": 5432,
+#     "dbname": "postgres",
+#     "user": "postgres",
+#     "password": "...",
+# }
+# While central is unreachable, unsent rows stay in telemetry.db until they
+# are SPOOL_AFTER_DAYS old; only then, shortly before retention prunes them,
+# are they copied into compressed segment files under SPOOL_DIR (at most
+# SPOOL_MAX_MB, oldest dropped first). Both are sent once central is back.
+SPOOL_DIR = os.path.join(os.path.dirname(__file__), "spool")
+SPOOL_MAX_MB = 64
+SPOOL_AFTER_DAYS = RAW_RETENTION_DAYS - 1
+replicator = None
+if CENTRAL_URL is not None or PG_CONFIG is not None:
+    sink = (HttpSink(CENTRAL_URL, token=CENTRAL_TOKEN) if CENTRAL_URL is not None
+            else PostgresSink(PG_CONFIG))
+    replicator = Replicator(DB_PATH, VEHICLE_ID, sink,
+                            spool=Spool(SPOOL_DIR, max_bytes=SPOOL_MAX_MB * 1024 * 1024),
+                            spool_after=SPOOL_AFTER_DAYS * 86400).start()
+
+# /api/history limits: raw rows are only returned for windows up to
+# RAW_HISTORY_MAX_SECONDS; longer windows are bucketed automatically and
+# served from the rollup tables.
+MAX_HISTORY_POINTS = 2000
+DEFAULT_HISTORY_POINTS = 1000
+RAW_HISTORY_MAX_SECONDS = 86400
+HISTORY_MAX_SECONDS = 365 * 86400
+
+# /api/sparkline: SVG images of about SPARKLINE_POINTS buckets for the
+# Chart.js-free /?lite=1 page on weak tablets, cached until the writer
+# commits a newer row (at least SPARKLINE_MIN_AGE seconds or one bucket)
+SPARKLINE_POINTS = 80
+SPARKLINE_MIN_AGE = 10
+SPARKLINE_METRICS = ("speed", "distance", "cpu_temp")
+sparkline_cache = SparklineCache(SPARKLINE_MIN_AGE)     # (metric, seconds, width, height) -> svg
+
+# Every control-loop sample (20 Hz) for the last few minutes, in memory
+HIGHRES_SECONDS = 300
+HIGHRES_DUMP_DIR = os.path.join(os.path.dirname(__file__), "highres")
+HIGHRES_DUMP_DELAY = 5.0       # s after an obstacle, so the dump shows the aftermath
+HIGHRES_DUMP_COOLDOWN = 30.0   # min s between obstacle-triggered dumps
+highres = TelemetryRing(seconds=HIGHRES_SECONDS, rate_hz=20)
+last_highres_dump = 0.0
+
+
+def dump_highres(reason="manual"):
+    """Write the high-res ring buffer to HIGHRES_DUMP_DIR."""
     try:
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO telemetry (
-              ts, speed, raw_speed, distance,
-              line_l, line_m, line_r,
-              motion, line_state, obstacle, cpu_temp,
-              line_track, avoid_obstacles, color_follow, color_detect, face_detect
-            ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-        """, (
-            row["ts"], row["speed"], row["raw_speed"], row["distance"],
-            row["line_l"], row["line_m"], row["line_r"],
-            row["motion"], row["line_state"], row["obstacle"], row["cpu_temp"],
-            row["line_track"], row["avoid_obstacles"],
-            row["color_follow"], row["color_detect"], row["face_detect"]
-        ))
-        conn.commit()
+        name, rows = dump_to_dir(highres, HIGHRES_DUMP_DIR, reason)
+        print("High-res telemetry dumped to %s (%d rows)" % (name, rows))
+        return name, rows
     except Exception as e:
-        print("DB insert error:", e)
+        print("High-res dump error:", e)
+        return None, 0
+
+
+def on_obstacle_event(now):
+    """Schedule a high-res dump shortly after an obstacle appears."""
+    global last_highres_dump
+    if now - last_highres_dump < HIGHRES_DUMP_COOLDOWN:
+        return
+    last_highres_dump = now
+    t = threading.Timer(HIGHRES_DUMP_DELAY, dump_highres, args=("obstacle",))
+    t.daemon = True
+    t.start()
 
 
 # ===== Robot init =====
@@ -178,18 +255,63 @@ modes = {
     "color_follow": False,
 }
 
-telemetry = {
-    "speed": 0,               # smoothed speed 0–100
-    "raw_speed": 0,           # unsmoothed |speed|
-    "distance": 0,
-    "line": [0, 0, 0],
-    "motion": "stop",
-    "line_state": "stop",
-    "obstacle_detected": False,
-    "cpu_temp": 0.0,
-}
+MODE_NAMES = tuple(modes)
+
+
+class TelemetrySnapshot(namedtuple("TelemetrySnapshot", (
+        "version", "ts",
+        "speed",              # smoothed speed 0–100
+        "raw_speed",          # unsmoothed |speed|
+        "distance", "line", "motion", "line_state", "obstacle_detected", "cpu_temp",
+        "modes",              # tuple of bools in MODE_NAMES order
+        "speed_limit", "safe_distance", "danger_distance"))):
+    """
+    Immutable telemetry + settings as seen by one control-loop iteration.
+
+    The loop builds a new one outside any lock and publishes it by swapping
+    the `current_snapshot` reference; HTTP handlers just read that reference.
+    `version` only changes when the content (anything but ts) changes.
+    """
+    __slots__ = ()
+
+    def to_status(self):
+        """The /api/status payload."""
+        return {
+            "ts": self.ts,
+            "speed": self.speed,
+            "raw_speed": self.raw_speed,
+            "distance": self.distance,
+            "line": list(self.line),
+            "modes": dict(zip(MODE_NAMES, self.modes)),
+            "speed_limit": self.speed_limit,
+            "motion": self.motion,
+            "line_state": self.line_state,
+            "obstacle_detected": self.obstacle_detected,
+            "safe_distance": self.safe_distance,
+            "danger_distance": self.danger_distance,
+            "cpu_temp": self.cpu_temp,
+        }
+
+
+current_snapshot = TelemetrySnapshot(
+    version=0, ts=0.0, speed=0, raw_speed=0, distance=0, line=(0, 0, 0),
+    motion="stop", line_state="stop", obstacle_detected=False, cpu_temp=0.0,
+    modes=tuple(modes.values()), speed_limit=speed_limit,
+    safe_distance=SAFE_DISTANCE, danger_distance=DANGER_DISTANCE,
+)
+
 
-state_lock = threading.Lock()
+def publish_snapshot(**fields):
+    """Swap in a new snapshot if anything changed (control loop only)."""
+    global current_snapshot
+    prev = current_snapshot
+    snap = prev._replace(**fields)
+    if snap[2:] != prev[2:]:
+        current_snapshot = snap._replace(version=prev.version + 1)
+    return current_snapshot
+
+
+state_lock = threading.Lock()   # joystick / modes / settings written by handlers
 last_log_time = 0.0  # last time we wrote a DB row
 
 # Camera / streaming
@@ -205,10 +327,12 @@ app = Flask(__name__, static_url_path="/static")
 
 @app.route("/")
 def index():
-    """Single page: controller + telemetry."""
+    """Single page: controller + telemetry (?lite=1: sparklines, no Chart.js)."""
     return render_template("index.html",
                            stream_url=f"http://{ip}:9000/mjpg",
-                           ip=ip)
+                           ip=ip,
+                           lite=request.args.get("lite") == "1",
+                           spark_age=SPARKLINE_MIN_AGE)
 
 
 @app.route("/api/move", methods=["POST"])
@@ -281,78 +405,248 @@ def api_settings():
 
 @app.route("/api/status", methods=["GET"])
 def api_status():
-    with state_lock:
-        return jsonify({
-            "speed": telemetry["speed"],
-            "raw_speed": telemetry["raw_speed"],
-            "distance": telemetry["distance"],
-            "line": telemetry["line"],
-            "modes": modes,
-            "speed_limit": speed_limit,
-            "motion": telemetry["motion"],
-            "line_state": telemetry["line_state"],
-            "obstacle_detected": telemetry["obstacle_detected"],
-            "safe_distance": SAFE_DISTANCE,
-            "danger_distance": DANGER_DISTANCE,
-            "cpu_temp": telemetry["cpu_temp"],
-        })
+    # No lock: the snapshot is immutable and swapped in atomically
+    return jsonify(current_snapshot.to_status())
+
+
+# Live status stream (Server-Sent Events). Each client gets an event only
+# when the status changed, and at least once per second while the control
+# loop runs (the telemetry charts take their live points from it), at most
+# ?rate= times per second.
+STREAM_MAX_HZ = 10
+STREAM_DEFAULT_HZ = 5
+STREAM_KEEPALIVE = 15.0    # s between comment lines on an idle stream
+_status_cache = (None, None)    # ((snapshot version, whole second of ts), serialised status)
+
+
+def status_payload():
+    """
+    Serialised status of the current snapshot, shared by all stream
+    clients: serialised once per snapshot version and second however many
+    viewers are connected.
+    """
+    global _status_cache
+    snap = current_snapshot
+    key = (snap.version, int(snap.ts))
+    cached_key, payload = _status_cache
+    if cached_key != key:
+        payload = json.dumps(snap.to_status(), separators=(",", ":"))
+        _status_cache = (key, payload)
+    return payload
+
+
+@app.route("/api/status/stream", methods=["GET"])
+def api_status_stream():
+    rate = request.args.get("rate", default=STREAM_DEFAULT_HZ, type=float)
+    rate = max(0.2, min(STREAM_MAX_HZ, rate))
+
+    def generate():
+        last = None
+        last_sent = time()
+        while True:
+            payload = status_payload()
+            if payload != last:
+                yield "data: %s\n\n" % payload
+                last = payload
+                last_sent = time()
+            elif time() - last_sent >= STREAM_KEEPALIVE:
+                yield ": keepalive\n\n"
+                last_sent = time()
+            sleep(1.0 / rate)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/telemetry/stats", methods=["GET"])
+def api_telemetry_stats():
+    """Counters for the telemetry logging pipeline."""
+    return jsonify({
+        "writer": writer.stats(),
+        "maintenance": maintenance.stats(),
+        "replication": replicator.stats() if replicator is not None else None,
+        "highres": {"samples": len(highres), "capacity": highres.capacity},
+    })
 
 
 @app.route("/api/history", methods=["GET"])
 def api_history():
     """
     Return recent telemetry history from SQLite for charts.
-    ?seconds=600 → last 10 minutes (default).
+    ?seconds=600 → last 10 minutes (default), up to a year. Windows longer
+    than a day are always bucketed.
+    ?max_points=N or ?bucket=S → SQLite aggregates the window into fixed
+    time buckets (avg/min/max per bucket) instead of returning every row.
+    ?format=columns → {"columns": {field: [values...]}} straight from the
+    cursor instead of one nested dict per row.
+    ?since=<ts> → only rows newer than ts (for buckets: the bucket starting
+    at ts and newer ones). Every response carries the next "cursor".
     """
     secs = request.args.get("seconds", default=600, type=int)
     if secs <= 0:
         secs = 600
-    if secs > 86400:
-        secs = 86400  # max 24h
-
+    if secs > HISTORY_MAX_SECONDS:
+        secs = HISTORY_MAX_SECONDS
+
+    bucket = request.args.get("bucket", type=float)
+    if bucket is not None and not (math.isfinite(bucket) and bucket > 0):
+        return jsonify({"error": "bucket must be a positive number of seconds"}), 400
+    max_points = request.args.get("max_points", type=int)
+    if not bucket and not max_points and secs > RAW_HISTORY_MAX_SECONDS:
+        max_points = DEFAULT_HISTORY_POINTS
+    if not bucket and max_points:
+        max_points = max(10, min(MAX_HISTORY_POINTS, max_points))
+        bucket = math.ceil(secs / max_points)
+    if bucket:
+        # Never finer than 1 s (the logging rate) or than MAX_HISTORY_POINTS;
+        # minute/hour multiples are served from the rollup tables
+        bucket = align_bucket(max(1.0, bucket, secs / MAX_HISTORY_POINTS))
+
+    since = request.args.get("since", type=float)
     cutoff = time() - secs
 
     try:
-        c = conn.cursor()
-        c.execute("""
-            SELECT ts,speed,raw_speed,distance,line_l,line_m,line_r,
-                   motion,line_state,obstacle,cpu_temp,
-                   line_track,avoid_obstacles,color_follow,color_detect,face_detect
-            FROM telemetry
-            WHERE ts >= ?
-            ORDER BY ts ASC
-        """, (cutoff,))
-        rows = c.fetchall()
+        with read_pool.connection() as conn:
+            if bucket:
+                rows = fetch_history_buckets(conn, cutoff, bucket, since)
+            else:
+                rows = fetch_history(conn, cutoff, since)
     except Exception as e:
         print("DB history error:", e)
         rows = []
 
-    history = []
-    for r in rows:
-        history.append({
-            "ts": r[0],
-            "speed": r[1],
-            "raw_speed": r[2],
-            "distance": r[3],
-            "line": [r[4], r[5], r[6]],
-            "motion": r[7],
-            "line_state": r[8],
-            "obstacle": bool(r[9]),
-            "cpu_temp": r[10],
-            "modes": {
-                "line_track": bool(r[11]),
-                "avoid_obstacles": bool(r[12]),
-                "color_follow": bool(r[13]),
-                "color_detect": bool(r[14]),
-                "face_detect": bool(r[15]),
-            }
-        })
-    return jsonify({"history": history})
+    if request.args.get("format") == "columns":
+        names = AGGREGATE_COLUMNS if bucket else TELEMETRY_COLUMNS
+        resp = {"columns": rows_to_columns(names, rows)}
+    elif bucket:
+        resp = {"history": [bucket_to_dict(r) for r in rows]}
+    else:
+        resp = {"history": [row_to_dict(r) for r in rows]}
+
+    if bucket:
+        resp["bucket"] = bucket
+    resp["cursor"] = rows[-1][0] if rows else (since if since is not None else cutoff)
+    return jsonify(resp)
+
+
+def row_to_dict(r):
+    """One raw telemetry row (TELEMETRY_COLUMNS) in the /api/history shape."""
+    return {
+        "ts": r[0],
+        "speed": r[1],
+        "raw_speed": r[2],
+        "distance": r[3],
+        "line": [r[4], r[5], r[6]],
+        "motion": r[7],
+        "line_state": r[8],
+        "obstacle": bool(r[9]),
+        "cpu_temp": r[10],
+        "modes": {
+            "line_track": bool(r[11]),
+            "avoid_obstacles": bool(r[12]),
+            "color_follow": bool(r[13]),
+            "color_detect": bool(r[14]),
+            "face_detect": bool(r[15]),
+        }
+    }
+
+
+def bucket_to_dict(r):
+    """One aggregated bucket (AGGREGATE_COLUMNS) in the /api/history shape."""
+    return {
+        "ts": r[0],
+        "n": r[1],
+        "speed": r[2],
+        "speed_min": r[3],
+        "speed_max": r[4],
+        "raw_speed": r[5],
+        "distance": r[6],
+        "distance_min": r[7],
+        "distance_max": r[8],
+        "line": [r[9], r[10], r[11]],
+        "obstacle": r[12],              # fraction of the bucket (0..1)
+        "cpu_temp": r[13],
+        "cpu_temp_min": r[14],
+        "cpu_temp_max": r[15],
+        "modes": {                      # duty cycles (0..1)
+            "line_track": r[16],
+            "avoid_obstacles": r[17],
+            "color_follow": r[18],
+            "color_detect": r[19],
+            "face_detect": r[20],
+        }
+    }
+
+
+@app.route("/api/sparkline", methods=["GET"])
+def api_sparkline():
+    """
+    SVG sparkline of one metric (avg line over the min..max band).
+    ?metric=speed|distance|cpu_temp (default speed), ?seconds=3600,
+    ?width= / ?height= in px.
+    """
+    metric = request.args.get("metric", "speed")
+    if metric not in SPARKLINE_METRICS:
+        return jsonify({"error": "metric must be one of: %s" % ", ".join(SPARKLINE_METRICS)}), 400
+    secs = request.args.get("seconds", default=3600, type=int)
+    if secs <= 0:
+        secs = 3600
+    secs = min(secs, HISTORY_MAX_SECONDS)
+    width = max(40, min(request.args.get("width", default=SPARKLINE_WIDTH, type=int), 1200))
+    height = max(16, min(request.args.get("height", default=SPARKLINE_HEIGHT, type=int), 400))
+
+    bucket = align_bucket(max(1.0, secs / SPARKLINE_POINTS))
+    svg = sparkline_cache.get((metric, secs, width, height), writer.stats()["newest_ts"],
+                              lambda: render_sparkline(metric, secs, bucket, width, height),
+                              min_age=bucket)
+
+    resp = Response(svg, mimetype="image/svg+xml")
+    resp.headers["Cache-Control"] = "max-age=%d" % SPARKLINE_MIN_AGE
+    return resp
+
+
+def render_sparkline(metric, secs, bucket, width, height):
+    """SVG for api_sparkline: the last `secs` seconds in `bucket`-second buckets."""
+    now = time()
+    try:
+        with read_pool.connection() as conn:
+            rows = fetch_history_buckets(conn, now - secs, bucket)
+    except Exception as e:
+        print("DB sparkline error:", e)
+        rows = []
+    i = AGGREGATE_COLUMNS.index(metric)
+    points = [(r[0], r[i], r[i + 1], r[i + 2]) for r in rows]
+    return render_svg(points, now - secs, now, bucket, width=width, height=height,
+                      color=METRIC_COLORS.get(metric, DEFAULT_COLOR), title=metric)
+
+
+@app.route("/api/history/highres", methods=["GET"])
+def api_history_highres():
+    """
+    Full-rate (20 Hz) samples from the in-memory ring buffer, one array per
+    column. ?seconds=60 → last minute (default), up to HIGHRES_SECONDS.
+    """
+    secs = request.args.get("seconds", default=60, type=float)
+    if secs <= 0 or secs > HIGHRES_SECONDS:
+        secs = HIGHRES_SECONDS
+    return jsonify({
+        "rate_hz": highres.rate_hz,
+        "columns": highres.columns(since=time() - secs),
+    })
+
+
+@app.route("/api/history/highres/dump", methods=["POST"])
+def api_history_highres_dump():
+    name, rows = dump_highres("manual")
+    if name is None:
+        return jsonify({"error": "dump failed"}), 500
+    return jsonify({"file": name, "rows": rows})
 
 
 def control_loop():
     global speed, smooth_speed, SAFE_DISTANCE, DANGER_DISTANCE, last_log_time
     last_face = False
+    last_obstacle = False
     last_color = False    # for color detect
     color_index = 0
     alpha = 0.85          # smoothing factor
@@ -508,56 +802,62 @@ def control_loop():
         except Exception as e:
             print("Control loop error:", e)
 
-        # Telemetry update + logging
+        # Telemetry update + logging (no lock held: only this thread writes
+        # the snapshot, and readers never see a half-built one)
         try:
             cpu_temp = read_cpu_temp()
-            row = None
-            log_now = False
-
-            with state_lock:
-                telemetry["distance"] = int(dist)
-                telemetry["line"] = line_vals
-                telemetry["line_state"] = line_state
-                telemetry["motion"] = motion
-                telemetry["obstacle_detected"] = bool(obstacle)
-
-                # raw + smoothed speed
-                telemetry["raw_speed"] = int(abs(speed))
-                target_display = max(0.0, min(float(abs(speed)), 100.0))
-                smooth_speed = alpha * smooth_speed + (1.0 - alpha) * target_display
-                telemetry["speed"] = int(smooth_speed + 0.5)
-
-                telemetry["cpu_temp"] = cpu_temp
-
-                # Prepare row for DB logging
-                line_l = int(line_vals[0]) if len(line_vals) > 0 else 0
-                line_m = int(line_vals[1]) if len(line_vals) > 1 else 0
-                line_r = int(line_vals[2]) if len(line_vals) > 2 else 0
-
-                row = {
-                    "ts": now,
-                    "speed": telemetry["speed"],
-                    "raw_speed": telemetry["raw_speed"],
-                    "distance": telemetry["distance"],
-                    "line_l": line_l,
-                    "line_m": line_m,
-                    "line_r": line_r,
-                    "motion": telemetry["motion"],
-                    "line_state": telemetry["line_state"],
-                    "obstacle": 1 if telemetry["obstacle_detected"] else 0,
-                    "cpu_temp": telemetry["cpu_temp"],
-                    "line_track": 1 if modes["line_track"] else 0,
-                    "avoid_obstacles": 1 if modes["avoid_obstacles"] else 0,
-                    "color_follow": 1 if modes["color_follow"] else 0,
-                    "color_detect": 1 if modes["color_detect"] else 0,
-                    "face_detect": 1 if modes["face_detect"] else 0,
-                }
-
-                if now - last_log_time >= 1.0:
-                    last_log_time = now
-                    log_now = True
-
-            if log_now and row is not None:
+
+            # raw + smoothed speed
+            target_display = max(0.0, min(float(abs(speed)), 100.0))
+            smooth_speed = alpha * smooth_speed + (1.0 - alpha) * target_display
+
+            line_l = int(line_vals[0]) if len(line_vals) > 0 else 0
+            line_m = int(line_vals[1]) if len(line_vals) > 1 else 0
+            line_r = int(line_vals[2]) if len(line_vals) > 2 else 0
+
+            snap = publish_snapshot(
+                ts=now,
+                speed=int(smooth_speed + 0.5),
+                raw_speed=int(abs(speed)),
+                distance=int(dist),
+                line=tuple(line_vals),
+                motion=motion,
+                line_state=line_state,
+                obstacle_detected=bool(obstacle),
+                cpu_temp=cpu_temp,
+                modes=(line_on, avoid_on, face_on, color_on, follow_on),
+                speed_limit=sp_lim,
+                safe_distance=safe_dist,
+                danger_distance=danger_dist,
+            )
+
+            # Row for DB logging / high-res buffer
+            row = {
+                "ts": now,
+                "speed": snap.speed,
+                "raw_speed": snap.raw_speed,
+                "distance": snap.distance,
+                "line_l": line_l,
+                "line_m": line_m,
+                "line_r": line_r,
+                "motion": snap.motion,
+                "line_state": snap.line_state,
+                "obstacle": 1 if snap.obstacle_detected else 0,
+                "cpu_temp": snap.cpu_temp,
+                "line_track": 1 if line_on else 0,
+                "avoid_obstacles": 1 if avoid_on else 0,
+                "color_follow": 1 if follow_on else 0,
+                "color_detect": 1 if color_on else 0,
+                "face_detect": 1 if face_on else 0,
+            }
+
+            highres.append(row)
+            if obstacle and not last_obstacle:
+                on_obstacle_event(now)
+            last_obstacle = bool(obstacle)
+
+            if now - last_log_time >= 1.0:
+                last_log_time = now
                 log_telemetry_row(row)
 
         except Exception as e:
@@ -583,6 +883,22 @@ if __name__ == "__main__":
             pass
             
         try:
-            conn.close()
+            maintenance.close()
+        except Exception:
+            pass
+
+        if replicator is not None:
+            try:
+                replicator.close()
+            except Exception:
+                pass
+
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+        try:
+            read_pool.close()
         except Exception:
             pass
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the central dashboard under fleet load.
+
+Optionally seeds --vehicles x --hours of history (via loadgen), then runs
+each scenario with --pollers concurrent clients for --duration seconds
+against a running central_dashboard.py and reports p50/p95/p99 latency
+plus the DB and JSON time the server reports in its Server-Timing header.
+Results are written as JSON so runs before / after a query or index
+change can be compared.
+
+  python3 central_dashboard.py &
+  python3 bench_dashboard.py --seed-data --vehicles 200 --hours 24 --out bench.json
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import threading
+import urllib.error
+import urllib.request
+from time import monotonic, sleep, time
+
+# (scenario name, path, send If-None-Match); history scenarios are added
+# per --windows entry
+BASE_SCENARIOS = (
+    ("vehicles", "/api/vehicles", False),
+    ("vehicles_revalidate", "/api/vehicles", True),
+)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def parse_server_timing(header):
+    """'db;dur=1.2, json;dur=0.3' -> {"db": 1.2, "json": 0.3}"""
+    out = {}
+    for part in (header or "").split(","):
+        fields = [f.strip() for f in part.split(";")]
+        for f in fields[1:]:
+            if f.startswith("dur="):
+                try:
+                    out[fields[0]] = float(f[4:])
+                except ValueError:
+                    pass
+    return out
+
+
+def summarise(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+def run_scenario(base_url, paths, revalidate, pollers, duration, timeout):
+    """Hammer `paths` (picked at random per request) from `pollers` threads."""
+    lock = threading.Lock()
+    latency, db, ser, sizes = [], [], [], []
+    counts = {"requests": 0, "errors": 0, "not_modified": 0}
+    deadline = monotonic() + duration
+
+    def poller():
+        etags = {}
+        while monotonic() < deadline:
+            path = random.choice(paths)
+            req = urllib.request.Request(base_url + path)
+            if revalidate and path in etags:
+                req.add_header("If-None-Match", etags[path])
+            start = monotonic()
+            status, body, headers = None, b"", {}
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as resp:
+                    body = resp.read()
+                    status, headers = resp.status, resp.headers
+            except urllib.error.HTTPError as e:
+                status, headers = e.code, e.headers
+            except Exception:
+                pass
+            ms = (monotonic() - start) * 1000.0
+
+            timing = parse_server_timing(headers.get("Server-Timing") if headers else None)
+            with lock:
+                counts["requests"] += 1
+                if status not in (200, 304):
+                    counts["errors"] += 1
+                    continue
+                if status == 304:
+                    counts["not_modified"] += 1
+                latency.append(ms)
+                sizes.append(len(body))
+                db.append(timing.get("db", 0.0))
+                ser.append(timing.get("json", 0.0))
+            if headers and headers.get("ETag"):
+                etags[path] = headers.get("ETag")
+
+    threads = [threading.Thread(target=poller, daemon=True) for _ in range(pollers)]
+    t0 = monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = monotonic() - t0
+
+    return dict(counts,
+                rps=round(counts["requests"] / elapsed, 1) if elapsed > 0 else 0.0,
+                latency_ms=summarise(latency),
+                db_ms=summarise(db),
+                json_ms=summarise(ser),
+                bytes_avg=round(sum(sizes) / len(sizes)) if sizes else 0)
+
+
+def seed(args):
+    from loadgen import DbTarget, backfill, vehicle_ids
+    from seed_vehicle_telemetry import PG_CONFIG
+
+    random.seed(args.seed)
+    target = DbTarget({"dsn": args.dsn} if args.dsn else PG_CONFIG)
+    try:
+        backfill(target, vehicle_ids(args.vehicles), args.hours / 24.0, 1.0, 50000)
+    finally:
+        target.close()
+
+
+def fetch_vehicle_ids(base_url, timeout):
+    with urllib.request.urlopen(base_url + "/api/vehicles", timeout=timeout) as resp:
+        return [v["vehicle_id"] for v in json.loads(resp.read())["vehicles"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark central dashboard endpoints.")
+    parser.add_argument("--url", default="http://localhost:8000", help="running central_dashboard.py")
+    parser.add_argument("--pollers", type=int, default=10, help="concurrent clients per scenario")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument("--windows", default="600,86400",
+                        help="comma-separated /api/history windows in seconds")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed-data", action="store_true",
+                        help="backfill --vehicles x --hours first (direct to PostgreSQL)")
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--hours", type=float, default=24.0)
+    parser.add_argument("--dsn", help="PostgreSQL DSN for --seed-data")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    if args.seed_data:
+        seed(args)
+        sleep(2.0)    # let the dashboard's caches notice the new rows
+
+    random.seed(args.seed)
+    ids = fetch_vehicle_ids(base_url, args.timeout)
+    if not ids:
+        raise SystemExit("No vehicles on %s; run with --seed-data or loadgen.py first" % base_url)
+
+    scenarios = [(name, [path], reval) for name, path, reval in BASE_SCENARIOS]
+    for secs in (int(w) for w in args.windows.split(",") if w.strip()):
+        scenarios.append(("history_%ds" % secs, [
+            "/api/history?vehicle_id=%s&seconds=%d&format=columns"
+            % (urllib.request.quote(vid), secs) for vid in ids], False))
+
+    results = {}
+    for name, paths, reval in scenarios:
+        print("%-22s %d pollers x %.0f s ..." % (name, args.pollers, args.duration), end=" ", flush=True)
+        r = run_scenario(base_url, paths, reval, args.pollers, args.duration, args.timeout)
+        results[name] = r
+        lat = r["latency_ms"] or {}
+        print("%6.1f req/s  p50 %s  p95 %s  p99 %s ms  (db p50 %s, json p50 %s, %d errors)" % (
+            r["rps"], lat.get("p50"), lat.get("p95"), lat.get("p99"),
+            (r["db_ms"] or {}).get("p50"), (r["json_ms"] or {}).get("p50"), r["errors"]))
+
+    report = {
+        "timestamp": time(),
+        "host": platform.node(),
+        "url": base_url,
+        "vehicles": len(ids),
+        "config": {k: v for k, v in vars(args).items() if k != "dsn"},
+        "scenarios": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Wrote", args.out)
+
+
+if __name__ == "__main__":
+    main()
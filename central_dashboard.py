@@ -1,6 +1,23 @@
-import psycopg2
+import hashlib
+import hmac
+import json
+import threading
 import time
-from flask import Flask, jsonify, render_template_string, request
+from contextlib import contextmanager
+
+from flask import Flask, Response, g, jsonify, render_template_string, request, stream_with_context
+from psycopg2 import DataError, IntegrityError
+
+from fleet_db import (
+    INGEST_COLUMNS, ROLLUP_HISTORY_COLUMNS, SUMMARY_GROUPS, SUMMARY_MODES, NotifyListener,
+    SPARKLINE_METRICS, PgPool, decode_batch, fetch_events, fetch_rollup, fetch_sparkline,
+    fleet_summary, ingest_rows, refresh_rollups, thermal_outliers,
+)
+from fleet_schema import ROLLUP_TABLES, ensure_schema, maintain_partitions, prune_rows
+from sparklines import (
+    DEFAULT_COLOR, METRIC_COLORS, SPARKLINE_HEIGHT, SPARKLINE_WIDTH, SparklineCache, render_svg,
+)
+from telemetry_events import EVENT_COLUMNS, EventDetector
 
 # ===== PostgreSQL config (must match the Pi-side PG_CONFIG) =====
 PG_CONFIG = {
@@ -11,11 +28,120 @@ PG_CONFIG = {
     "password": "2710",
 }
 
+# Carts authenticate to /api/ingest with this shared secret in the
+# X-Ingest-Token header (CENTRAL_TOKEN in app.py). None refuses all uploads.
+INGEST_TOKEN = None
+# Compressed request bodies above this are refused (413) before being read;
+# the decompressed size is capped by fleet_db.MAX_BATCH_BYTES
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+# Shared connection pool: every browser tab polls /api/vehicles, so requests
+# reuse open connections instead of paying TCP + auth setup each time.
+PG_POOL_MIN = 2
+PG_POOL_MAX = 20
+
+# vehicle_telemetry is partitioned by day: partitions are created
+# PARTITION_DAYS_AHEAD days in advance and dropped once older than
+# TELEMETRY_RETENTION_DAYS (None keeps history forever).
+TELEMETRY_RETENTION_DAYS = 90
+PARTITION_DAYS_AHEAD = 7
+PARTITION_CHECK_INTERVAL = 3600
+
+# /api/history resolution by window: raw rows up to RAW_HISTORY_MAX_SECONDS,
+# minute rollups up to MINUTE_HISTORY_MAX_SECONDS, hourly rollups beyond.
+# Rollups are refreshed from the minutes ingest marked dirty every
+# ROLLUP_REFRESH_INTERVAL seconds.
+RAW_HISTORY_MAX_SECONDS = 1800
+MINUTE_HISTORY_MAX_SECONDS = 2 * 86400
+HISTORY_MAX_SECONDS = 365 * 86400
+ROLLUP_REFRESH_INTERVAL = 10
+# Minute rollups are only read for windows up to MINUTE_HISTORY_MAX_SECONDS;
+# older ones are pruned with the partitions (hourly rollups are kept)
+MINUTE_ROLLUP_RETENTION_SECONDS = MINUTE_HISTORY_MAX_SECONDS + 86400
+
+# /api/fleet/summary: carts log one row per second, so sample counts are
+# seconds; vehicles whose mean CPU temperature is THERMAL_OUTLIER_Z standard
+# deviations above the fleet's are flagged
+SAMPLE_SECONDS = 1.0
+THERMAL_OUTLIER_Z = 2.0
+
+# /api/events: default window and the most rows one request returns.
+# Events are kept EVENT_RETENTION_DAYS (None keeps them forever).
+EVENTS_DEFAULT_SECONDS = 86400
+EVENTS_MAX_LIMIT = 5000
+EVENT_RETENTION_DAYS = 365
+
+# /api/sparkline: SVG images for the cards and the Chart.js-free /?lite=1
+# view, about SPARKLINE_POINTS buckets wide, cached per vehicle until it
+# reports a newer row (at least SPARKLINE_MIN_AGE seconds)
+SPARKLINE_DEFAULT_SECONDS = 3600
+SPARKLINE_POINTS = 80
+SPARKLINE_MIN_AGE = 30
+
+# /api/vehicles answers are reused until ingest_generation changes. While
+# LISTEN is connected every ingest (from any process or cart) bumps it, so
+# nothing else expires them; while it is down they also expire after
+# VEHICLES_CACHE_TTL seconds.
+VEHICLES_CACHE_TTL = 1.0
+
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+pg_pool = PgPool(PG_CONFIG, minconn=PG_POOL_MIN, maxconn=PG_POOL_MAX)
 
+# (generation, expires, etag, body, vehicles), replaced as a whole
+vehicles_cache = None
+vehicles_fill_lock = threading.Lock()
+ingest_generation = 0
+# Notified on every ingest_generation bump; wakes the vehicle streams
+vehicles_changed = threading.Condition()
+# Per-vehicle transition state for the events stored at ingest; a cart's
+# batches can arrive on several request threads
+event_detector = EventDetector()
+event_detector_lock = threading.Lock()
+# (vehicle_id, metric, seconds, width, height) -> (etag, svg)
+sparkline_cache = SparklineCache(SPARKLINE_MIN_AGE)
 
-def get_pg_conn():
-    return psycopg2.connect(**PG_CONFIG)
+# /api/stream/vehicles: pushes are driven by PostgreSQL NOTIFY (sent by every
+# ingest, from any dashboard process or cart); while LISTEN is down the
+# streams fall back to checking every VEHICLES_STREAM_POLL seconds.
+VEHICLES_STREAM_KEEPALIVE = 15.0
+VEHICLES_STREAM_POLL = 2.0
+
+
+# Column order of the /api/history query (also the ?format=columns keys)
+HISTORY_COLUMNS = (
+    "ts", "speed", "raw_speed", "distance",
+    "line_l", "line_m", "line_r",
+    "motion", "line_state", "obstacle", "cpu_temp",
+    "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+
+@contextmanager
+def server_timing(name):
+    """Add the time spent in the block to this response's Server-Timing header."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = g.setdefault("server_timing", {})
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000.0
+
+
+@app.after_request
+def add_server_timing(resp):
+    timings = g.get("server_timing")
+    if timings:
+        resp.headers["Server-Timing"] = ", ".join(
+            "%s;dur=%.2f" % item for item in timings.items())
+    return resp
+
+
+def rows_to_columns(names, rows):
+    """Transpose cursor rows into {column: [values...]} for ?format=columns."""
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
 
 
 INDEX_HTML = r"""
@@ -161,6 +287,16 @@ INDEX_HTML = r"""
       width: 100%;
       height: 170px;
     }
+    .graph-spark {
+      width: 100%;
+      height: 170px;
+    }
+    .card .spark {
+      display: block;
+      width: 100%;
+      height: 32px;
+      margin-top: 6px;
+    }
 
     @media (max-width: 700px) {
       .graph-card canvas {
@@ -177,6 +313,7 @@ INDEX_HTML = r"""
     <h1>Vehicle Status</h1>
     <div class="subtitle">
       Central view of all IntelliCart vehicles. Click one vehicle to see its graphs (speed, distance, CPU temp, modes & obstacles).
+      {% if lite %}<a href="/">Full view</a>{% else %}<a href="/?lite=1">Lite view</a> (no chart library, for slow displays){% endif %}
     </div>
 
     <div id="vehicles" class="vehicles-grid">
@@ -187,8 +324,31 @@ INDEX_HTML = r"""
     <div id="graphs">
       <h2>History: <span id="graphs-vid"></span></h2>
       <div class="graphs-note">
-        Showing recent data (last 10 minutes if available) from PostgreSQL.
+        Window:
+        <select id="history-window">
+          <option value="600" selected>10 minutes</option>
+          <option value="3600">1 hour</option>
+          <option value="86400">24 hours</option>
+          <option value="604800">7 days</option>
+        </select>
+        &nbsp;Windows over 30 minutes are drawn from per-minute / per-hour rollups.
       </div>
+      {% if lite %}
+      <div class="graph-grid">
+        <div class="graph-card">
+          <h3>Speed (smoothed)</h3>
+          <img class="graph-spark" data-metric="speed" alt="">
+        </div>
+        <div class="graph-card">
+          <h3>Distance (cm)</h3>
+          <img class="graph-spark" data-metric="distance" alt="">
+        </div>
+        <div class="graph-card">
+          <h3>CPU Temperature (°C)</h3>
+          <img class="graph-spark" data-metric="cpu_temp" alt="">
+        </div>
+      </div>
+      {% else %}
       <div class="graph-grid">
         <div class="graph-card">
           <h3>Speed (smoothed)</h3>
@@ -207,11 +367,28 @@ INDEX_HTML = r"""
           <canvas id="g-modes"></canvas>
         </div>
       </div>
+      {% endif %}
     </div>
   </div>
 
+  {% if not lite %}
   <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+  {% endif %}
   <script>
+    // Lite view: server-rendered SVG sparklines instead of Chart.js
+    const LITE = {{ "true" if lite else "false" }};
+    const SPARK_MAX_AGE = {{ spark_age }};
+
+    // The version parameter changes at most every SPARK_MAX_AGE seconds of
+    // `ts`, so re-rendered cards reuse the browser's cached image
+    function sparkUrl(vid, metric, seconds, ts, width, height) {
+      let url = "/api/sparkline?vehicle_id=" + encodeURIComponent(vid) +
+                "&metric=" + metric + "&seconds=" + seconds +
+                "&v=" + Math.floor((ts || 0) / SPARK_MAX_AGE);
+      if(width) url += "&width=" + width + "&height=" + height;
+      return url;
+    }
+
     // ===== Vehicle list + selection =====
     let selectedVehicleId = null;
 
@@ -227,6 +404,13 @@ INDEX_HTML = r"""
       return Math.round(h) + " h ago";
     }
 
+    // vehicle_id, motion etc. come from the carts: never insert them raw
+    function escapeHtml(s) {
+      return String(s).replace(/[&<>"']/g, c => ({
+        "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"
+      })[c]);
+    }
+
     function selectVehicle(vid) {
       selectedVehicleId = vid;
       // Highlight card
@@ -238,69 +422,129 @@ INDEX_HTML = r"""
       loadVehicleHistory(vid);
     }
 
+    // Cards are created once per vehicle and patched in place; the stream
+    // only carries the vehicles that changed.
+    const cards = {};   // vehicle_id -> card element
+
+    function renderCard(card, v) {
+      const motion = v.motion || "stop";
+      const obstacle = v.obstacle ? true : false;
+      const modes = v.modes || {};
+      const line = v.line || [0,0,0];
+
+      let html = "";
+      html += "<div class='vehicle-id'>" + escapeHtml(v.vehicle_id || "Unknown vehicle") + "</div>";
+      html += "<div class='status-line'>Motion: <b>" + escapeHtml(motion) + "</b>, Speed: <b>" + (v.speed||0).toFixed(1) + "</b></div>";
+      html += "<div class='status-line'>Distance: " + (v.distance||0).toFixed(1) + " cm, CPU: " + (v.cpu_temp||0).toFixed(1) + " °C</div>";
+      html += "<div class='status-line'>Line sensors: [" + escapeHtml(line.join(", ")) + "]</div>";
+
+      html += "<div class='badge-row'>";
+      if(modes.line_track)      html += "<span class='badge badge-active'>Line</span>";
+      if(modes.avoid_obstacles) html += "<span class='badge badge-active'>Avoid</span>";
+      if(modes.color_follow)    html += "<span class='badge badge-active'>Follow</span>";
+      if(modes.color_detect)    html += "<span class='badge'>Color detect</span>";
+      if(modes.face_detect)     html += "<span class='badge'>Face</span>";
+      if(obstacle)              html += "<span class='badge badge-danger'>Obstacle</span>";
+      html += "</div>";
+
+      html += "<img class='spark' alt='' title='Speed, last hour' src='" +
+              escapeHtml(sparkUrl(v.vehicle_id, "speed", 3600, v.ts)) + "'>";
+      html += "<div class='last-seen'>Last update: " + formatAgo(v.ts) + "</div>";
+
+      card.dataset.ts = v.ts || "";
+      card.innerHTML = html;
+    }
+
+    function applyVehicles(list, removed) {
+      const cont = document.getElementById("vehicles");
+      let added = false;
+
+      (removed || []).forEach(vid => {
+        if(cards[vid]) {
+          cards[vid].remove();
+          delete cards[vid];
+        }
+      });
+      list.forEach(v => {
+        let card = cards[v.vehicle_id];
+        if(!card) {
+          card = document.createElement("div");
+          card.className = "card";
+          if(v.vehicle_id === selectedVehicleId) card.classList.add("card-selected");
+          card.dataset.vehicleId = v.vehicle_id;
+          card.onclick = () => selectVehicle(v.vehicle_id);
+          cards[v.vehicle_id] = card;
+          added = true;
+        }
+        renderCard(card, v);
+      });
+
+      const ids = Object.keys(cards).sort();
+      if(!ids.length) {
+        cont.innerHTML = "<div class='status-line'>No data yet. Waiting for vehicles to report...</div>";
+        return;
+      }
+      if(added) {
+        if(!cont.querySelector(".card")) cont.innerHTML = "";
+        ids.forEach(vid => cont.appendChild(cards[vid]));
+      }
+
+      // If nothing selected yet, auto-select the first
+      if(!selectedVehicleId) selectVehicle(ids[0]);
+    }
+
+    // Full list (initial load / polling fallback): drop cards that vanished
+    function applyVehicleList(list) {
+      const seen = new Set(list.map(v => v.vehicle_id));
+      applyVehicles(list, Object.keys(cards).filter(vid => !seen.has(vid)));
+    }
+
     function updateVehicles() {
       fetch("/api/vehicles")
         .then(r => r.json())
-        .then(d => {
-          const cont = document.getElementById("vehicles");
-          const list = d.vehicles || [];
-          if(!list.length){
-            cont.innerHTML = "<div class='status-line'>No data yet. Waiting for vehicles to report...</div>";
-            return;
-          }
-          cont.innerHTML = "";
-          list.forEach(v => {
-            const card = document.createElement("div");
-            card.className = "card";
-            card.dataset.vehicleId = v.vehicle_id;
-
-            const motion = v.motion || "stop";
-            const obstacle = v.obstacle ? true : false;
-            const modes = v.modes || {};
-            const line = v.line || [0,0,0];
-
-            let html = "";
-            html += "<div class='vehicle-id'>" + (v.vehicle_id || "Unknown vehicle") + "</div>";
-            html += "<div class='status-line'>Motion: <b>" + motion + "</b>, Speed: <b>" + (v.speed||0).toFixed(1) + "</b></div>";
-            html += "<div class='status-line'>Distance: " + (v.distance||0).toFixed(1) + " cm, CPU: " + (v.cpu_temp||0).toFixed(1) + " °C</div>";
-            html += "<div class='status-line'>Line sensors: [" + line.join(", ") + "]</div>";
-
-            html += "<div class='badge-row'>";
-            if(modes.line_track)      html += "<span class='badge badge-active'>Line</span>";
-            if(modes.avoid_obstacles) html += "<span class='badge badge-active'>Avoid</span>";
-            if(modes.color_follow)    html += "<span class='badge badge-active'>Follow</span>";
-            if(modes.color_detect)    html += "<span class='badge'>Color detect</span>";
-            if(modes.face_detect)     html += "<span class='badge'>Face</span>";
-            if(obstacle)              html += "<span class='badge badge-danger'>Obstacle</span>";
-            html += "</div>";
-
-            html += "<div class='last-seen'>Last update: " + formatAgo(v.ts) + "</div>";
-
-            card.innerHTML = html;
-            card.onclick = () => selectVehicle(v.vehicle_id);
-
-            cont.appendChild(card);
-          });
-
-          // If nothing selected yet, auto-select the first
-          if(!selectedVehicleId && list.length > 0) {
-            selectVehicle(list[0].vehicle_id);
-          }
-        })
+        .then(d => applyVehicleList(d.vehicles || []))
         .catch(() => {
           // ignore for now
         });
     }
 
-    updateVehicles();
-    setInterval(updateVehicles, 2000);
+    let vehiclePoll = null;
+    function startVehiclePolling() {
+      if(vehiclePoll === null) {
+        updateVehicles();
+        vehiclePoll = setInterval(updateVehicles, 2000);
+      }
+    }
+
+    if(window.EventSource) {
+      const vehicleStream = new EventSource("/api/stream/vehicles");
+      vehicleStream.onmessage = e => {
+        try {
+          const d = JSON.parse(e.data);
+          if(d.full) applyVehicleList(d.vehicles || []);
+          else applyVehicles(d.vehicles || [], d.removed);
+        } catch(err) {}
+      };
+      vehicleStream.onerror = () => {
+        if(vehicleStream.readyState === EventSource.CLOSED) startVehiclePolling();
+      };
+    } else {
+      startVehiclePolling();
+    }
+
+    // Keep the "Last update" ages current between pushes
+    setInterval(() => {
+      Object.values(cards).forEach(card => {
+        const el = card.querySelector(".last-seen");
+        if(el) el.textContent = "Last update: " + formatAgo(Number(card.dataset.ts));
+      });
+    }, 5000);
 
     // ===== Charts setup =====
     let speedChart = null;
     let distanceChart = null;
     let cpuChart = null;
     let modesChart = null;
-    let tCounter = 0;
 
     function ensureCharts() {
       const speedCtx = document.getElementById("g-speed").getContext("2d");
@@ -399,64 +643,115 @@ INDEX_HTML = r"""
       }
     }
 
+    // ===== History: full load on selection, then incremental polling =====
+    let historySeconds = 600;
+    let historyVehicleId = null;
+    let historyCursor = null;
+    let historyPolling = false;
+
+    // Append a columnar history chunk to the charts (or replace their
+    // contents on a fresh load) and drop points older than the window.
+    // Rollup polls re-send the still-filling last bucket, so points from
+    // the first new ts on are replaced.
+    function applyHistory(c, replace) {
+      const num = arr => (arr || []).map(v => Number(v) || 0);
+      const ts = c.ts || [];
+      const oldest = Date.now() / 1000 - historySeconds;
+      const series = [
+        [speedChart, [num(c.speed)]],
+        [distanceChart, [num(c.distance)]],
+        [cpuChart, [num(c.cpu_temp)]],
+        [modesChart, [num(c.line_track), num(c.avoid_obstacles), num(c.color_follow), num(c.obstacle)]],
+      ];
+
+      series.forEach(([chart, data]) => {
+        if(replace) {
+          chart.data.labels = [];
+          chart.data.datasets.forEach(ds => ds.data = []);
+        } else if(ts.length) {
+          let keep = chart.data.labels.length;
+          while(keep > 0 && chart.data.labels[keep - 1] >= ts[0]) keep--;
+          chart.data.labels.length = keep;
+          chart.data.datasets.forEach(ds => ds.data.length = keep);
+        }
+        chart.data.labels.push(...ts);
+        chart.data.datasets.forEach((ds, i) => ds.data.push(...data[i]));
+
+        let drop = 0;
+        while(drop < chart.data.labels.length && chart.data.labels[drop] < oldest) drop++;
+        if(drop) {
+          chart.data.labels.splice(0, drop);
+          chart.data.datasets.forEach(ds => ds.data.splice(0, drop));
+        }
+        chart.update();
+      });
+    }
+
+    function historyUrl(vehicleId) {
+      return "/api/history?vehicle_id=" + encodeURIComponent(vehicleId) +
+             "&seconds=" + historySeconds + "&format=columns";
+    }
+
+    document.getElementById("history-window").onchange = e => {
+      historySeconds = Number(e.target.value) || 600;
+      loadVehicleHistory(historyVehicleId);
+    };
+
     function loadVehicleHistory(vehicleId) {
       if(!vehicleId) return;
       document.getElementById("graphs-vid").textContent = vehicleId;
       document.getElementById("graphs").style.display = "block";
+      historyVehicleId = vehicleId;
+      historyCursor = null;
+      if(LITE) {
+        refreshLiteGraphs();
+        return;
+      }
 
-      // Load last 10 minutes from central DB
-      fetch("/api/history?vehicle_id=" + encodeURIComponent(vehicleId) + "&seconds=600")
+      // Load last 10 minutes from central DB, one array per field
+      fetch(historyUrl(vehicleId))
         .then(r => r.json())
         .then(d => {
-          const history = d.history || [];
+          if(vehicleId !== historyVehicleId) return;   // selection changed meanwhile
           ensureCharts();
-          tCounter = 0;
-
-          const labels = [];
-          const speedData = [];
-          const distanceData = [];
-          const cpuData = [];
-          const lt = [];
-          const av = [];
-          const cf = [];
-          const obs = [];
-
-          history.forEach((s, i) => {
-            labels.push(i);
-            speedData.push(s.speed || 0);
-            distanceData.push(s.distance || 0);
-            cpuData.push(s.cpu_temp || 0);
-
-            const modes = s.modes || {};
-            lt.push(modes.line_track ? 1 : 0);
-            av.push(modes.avoid_obstacles ? 1 : 0);
-            cf.push(modes.color_follow ? 1 : 0);
-            obs.push(s.obstacle ? 1 : 0);
-          });
-
-          speedChart.data.labels = labels;
-          speedChart.data.datasets[0].data = speedData;
-          speedChart.update();
-
-          distanceChart.data.labels = labels;
-          distanceChart.data.datasets[0].data = distanceData;
-          distanceChart.update();
-
-          cpuChart.data.labels = labels;
-          cpuChart.data.datasets[0].data = cpuData;
-          cpuChart.update();
-
-          modesChart.data.labels = labels;
-          modesChart.data.datasets[0].data = lt;
-          modesChart.data.datasets[1].data = av;
-          modesChart.data.datasets[2].data = cf;
-          modesChart.data.datasets[3].data = obs;
-          modesChart.update();
+          applyHistory(d.columns || {}, true);
+          historyCursor = d.cursor;
         })
         .catch(() => {
           // ignore
         });
     }
+
+    function refreshLiteGraphs() {
+      if(!historyVehicleId) return;
+      const now = Date.now() / 1000;
+      document.querySelectorAll(".graph-spark").forEach(img => {
+        img.src = sparkUrl(historyVehicleId, img.dataset.metric, historySeconds, now, 480, 170);
+      });
+    }
+
+    // Only rows newer than the cursor are fetched and appended
+    function pollVehicleHistory() {
+      const vehicleId = historyVehicleId;
+      if(LITE) return;
+      if(!vehicleId || historyCursor === null || historyCursor === undefined || historyPolling) return;
+      historyPolling = true;
+      fetch(historyUrl(vehicleId) + "&since=" + historyCursor)
+        .then(r => r.json())
+        .then(d => {
+          if(vehicleId !== historyVehicleId) return;
+          const c = d.columns || {};
+          if((c.ts || []).length) applyHistory(c, false);
+          if(d.cursor !== null && d.cursor !== undefined) historyCursor = d.cursor;
+        })
+        .catch(() => {
+          // ignore
+        })
+        .finally(() => { historyPolling = false; });
+    }
+
+    setInterval(pollVehicleHistory, 2000);
+    if(LITE) setInterval(refreshLiteGraphs, SPARK_MAX_AGE * 1000);
   </script>
 </body>
 </html>
@@ -464,31 +759,24 @@ INDEX_HTML = r"""
 
 @app.route("/")
 def index():
-    return render_template_string(INDEX_HTML)
+    return render_template_string(INDEX_HTML, lite=request.args.get("lite") == "1",
+                                  spark_age=SPARKLINE_MIN_AGE)
 
 
-@app.route("/api/vehicles")
-def api_vehicles():
-    """
-    Returns latest status per vehicle_id from vehicle_telemetry.
-    Used for the cards at the top of the dashboard.
-    """
-    try:
-        with get_pg_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT DISTINCT ON (vehicle_id)
-                    vehicle_id, ts, speed, raw_speed, distance,
-                    line_l, line_m, line_r,
-                    motion, line_state, obstacle, cpu_temp,
-                    line_track, avoid_obstacles, color_follow, color_detect, face_detect
-                FROM vehicle_telemetry
-                ORDER BY vehicle_id, ts DESC;
-            """)
-            rows = cur.fetchall()
-    except Exception as e:
-        print("PostgreSQL /api/vehicles error:", e)
-        return jsonify({"vehicles": []})
+def load_vehicles():
+    """Latest status per vehicle_id from vehicle_latest (raises on DB errors)."""
+    with pg_pool.connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT
+                vehicle_id, ts, speed, raw_speed, distance,
+                line_l, line_m, line_r,
+                motion, line_state, obstacle, cpu_temp,
+                line_track, avoid_obstacles, color_follow, color_detect, face_detect
+            FROM vehicle_latest
+            ORDER BY vehicle_id;
+        """)
+        rows = cur.fetchall()
 
     vehicles = []
     for row in rows:
@@ -511,7 +799,166 @@ def api_vehicles():
                 "face_detect": bool(row[16]),
             }
         })
-    return jsonify({"vehicles": vehicles})
+    return vehicles
+
+
+def note_ingest():
+    """Invalidate cached /api/vehicles answers and wake the streams."""
+    global ingest_generation
+    with vehicles_changed:
+        ingest_generation += 1
+        vehicles_changed.notify_all()
+
+
+listener = NotifyListener(PG_CONFIG, note_ingest)
+
+
+def vehicles_cache_fresh(cached):
+    if cached is None or cached[0] != ingest_generation:
+        return False
+    return listener.connected or time.monotonic() < cached[1]
+
+
+def cached_vehicles():
+    """
+    (etag, json body, vehicle list) of /api/vehicles, rebuilt after an
+    ingest (or, without LISTEN, at most once per VEHICLES_CACHE_TTL);
+    concurrent misses share one query.
+    """
+    global vehicles_cache
+    cached = vehicles_cache
+    if vehicles_cache_fresh(cached):
+        return cached[2:]
+
+    with vehicles_fill_lock:
+        cached = vehicles_cache
+        if vehicles_cache_fresh(cached):
+            return cached[2:]
+        generation = ingest_generation
+        with server_timing("db"):
+            vehicles = load_vehicles()
+        with server_timing("json"):
+            body = json.dumps({"vehicles": vehicles})
+        etag = hashlib.sha1(body.encode()).hexdigest()[:20]
+        vehicles_cache = (generation, time.monotonic() + VEHICLES_CACHE_TTL, etag, body, vehicles)
+        return etag, body, vehicles
+
+
+@app.route("/api/vehicles")
+def api_vehicles():
+    """
+    Returns latest status per vehicle_id. Used for the cards at the top of
+    the dashboard; every tab polls it, so answers are cached briefly and
+    revalidated with ETag / If-None-Match (304 when nothing changed).
+    """
+    try:
+        etag, body, _ = cached_vehicles()
+    except Exception as e:
+        print("PostgreSQL /api/vehicles error:", e)
+        return jsonify({"vehicles": []})
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/stream/vehicles")
+def api_stream_vehicles():
+    """
+    Server-Sent Events feed of the vehicle cards. The first event carries
+    every vehicle ("full": true); later ones only the vehicles whose row
+    changed, plus the ids that disappeared.
+    """
+    def generate():
+        sent = {}    # vehicle_id -> ts last pushed to this client
+        full = True
+        last_sent = time.monotonic()
+        refresh = True
+        while True:
+            generation = ingest_generation
+            vehicles = None
+            if refresh:
+                try:
+                    vehicles = cached_vehicles()[2]
+                except Exception as e:
+                    print("PostgreSQL /api/stream/vehicles error:", e)
+
+            if vehicles is not None:
+                changed = [v for v in vehicles if sent.get(v["vehicle_id"]) != v["ts"]]
+                current = {v["vehicle_id"] for v in vehicles}
+                removed = [vid for vid in sent if vid not in current]
+                if full or changed or removed:
+                    yield "data: %s\n\n" % json.dumps(
+                        {"full": full, "vehicles": changed, "removed": removed},
+                        separators=(",", ":"))
+                    sent = {v["vehicle_id"]: v["ts"] for v in vehicles}
+                    full = False
+                    last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= VEHICLES_STREAM_KEEPALIVE:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+
+            timeout = VEHICLES_STREAM_KEEPALIVE if listener.connected else VEHICLES_STREAM_POLL
+            with vehicles_changed:
+                if ingest_generation == generation:
+                    vehicles_changed.wait(timeout)
+            # Without LISTEN nothing bumps the generation: re-check anyway
+            refresh = ingest_generation != generation or not listener.connected
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/api/ingest", methods=["POST"])
+def api_ingest():
+    """
+    Batch upload from the carts' replicators: a gzip/zstd-compressed body of
+    NDJSON or msgpack rows, loaded with COPY in one transaction. Rows whose
+    (vehicle_id, ts) already exist are skipped and counted as duplicates.
+    Obstacle, mode, line and CPU transitions are extracted into
+    vehicle_events in the same transaction.
+
+    Requires the X-Ingest-Token header. Batches the database cannot take
+    (bad rows, out-of-range values) get 400 so carts skip them instead of
+    retrying forever; only database outages are 503.
+    """
+    if INGEST_TOKEN is None:
+        return jsonify({"error": "ingest disabled (INGEST_TOKEN not set)"}), 403
+    token = request.headers.get("X-Ingest-Token", "")
+    if not hmac.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+        return jsonify({"error": "bad or missing X-Ingest-Token"}), 401
+
+    try:
+        rows = decode_batch(request.get_data(),
+                            request.headers.get("Content-Encoding"),
+                            request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with event_detector_lock:
+        events, pending = event_detector.detect(dict(zip(INGEST_COLUMNS, r)) for r in rows)
+    try:
+        with pg_pool.connection() as conn:
+            inserted = ingest_rows(conn, rows, events)
+    except (DataError, IntegrityError) as e:
+        print("PostgreSQL /api/ingest rejected batch:", e)
+        return jsonify({"error": "rejected batch: %s" % str(e).strip()}), 400
+    except Exception as e:
+        print("PostgreSQL /api/ingest error:", e)
+        return jsonify({"error": "database unavailable"}), 503
+    # Only now: a failed batch is re-sent and must be detected again
+    with event_detector_lock:
+        event_detector.commit(pending)
+    if inserted and not listener.connected:
+        # Otherwise the NOTIFY sent by ingest_rows does this
+        note_ingest()
+
+    return jsonify({"received": len(rows), "inserted": inserted,
+                    "duplicates": len(rows) - inserted, "events": len(events)})
 
 
 @app.route("/api/history")
@@ -520,7 +967,14 @@ def api_history():
     Return recent telemetry history for a single vehicle from PostgreSQL.
     Query params:
       - vehicle_id (required)
-      - seconds (optional, default 600)
+      - seconds (optional, default 600) → windows longer than
+        RAW_HISTORY_MAX_SECONDS come from the minute / hour rollups, with
+        the bucket size in "bucket"
+      - format=columns (optional) → one array per field instead of one
+        dict per row
+      - since (optional) → only rows newer than this ts; every response
+        carries the next "cursor" to pass back (rollup polls also repeat
+        the cursor's bucket, which may have grown)
     """
     vehicle_id = request.args.get("vehicle_id")
     if not vehicle_id:
@@ -529,27 +983,57 @@ def api_history():
     secs = request.args.get("seconds", default=600, type=int)
     if secs <= 0:
         secs = 600
-    if secs > 86400:
-        secs = 86400  # max 24h
+    if secs > HISTORY_MAX_SECONDS:
+        secs = HISTORY_MAX_SECONDS
 
+    since = request.args.get("since", type=float)
     cutoff = time.time() - secs
+    bucket = None
+    table = None
+    if secs > RAW_HISTORY_MAX_SECONDS:
+        table, bucket = ROLLUP_TABLES[0] if secs <= MINUTE_HISTORY_MAX_SECONDS else ROLLUP_TABLES[1]
+        cutoff = cutoff // bucket * bucket
+    if since is not None:
+        after = since - bucket if bucket else since
+    else:
+        after = cutoff - 1
 
     try:
-        with get_pg_conn() as conn:
+        with server_timing("db"), pg_pool.connection() as conn:
             cur = conn.cursor()
-            cur.execute("""
-                SELECT ts, speed, raw_speed, distance,
-                       line_l, line_m, line_r,
-                       motion, line_state, obstacle, cpu_temp,
-                       line_track, avoid_obstacles, color_follow, color_detect, face_detect
-                FROM vehicle_telemetry
-                WHERE vehicle_id = %s AND ts >= %s
-                ORDER BY ts ASC
-            """, (vehicle_id, cutoff))
-            rows = cur.fetchall()
+            if table is not None:
+                rows = fetch_rollup(cur, vehicle_id, table, cutoff, after)
+            else:
+                cur.execute("""
+                    SELECT %s
+                    FROM vehicle_telemetry
+                    WHERE vehicle_id = %%s AND ts >= %%s AND ts > %%s
+                    ORDER BY ts ASC
+                """ % ", ".join(HISTORY_COLUMNS), (vehicle_id, cutoff, after))
+                rows = cur.fetchall()
     except Exception as e:
         print("PostgreSQL /api/history error:", e)
-        return jsonify({"vehicle_id": vehicle_id, "history": []})
+        rows = []
+
+    cursor = rows[-1][0] if rows else (since if since is not None else cutoff)
+
+    with server_timing("json"):
+        return jsonify(history_payload(vehicle_id, cursor, bucket, rows,
+                                       request.args.get("format") == "columns"))
+
+
+def history_payload(vehicle_id, cursor, bucket, rows, columns):
+    """Response body of /api/history for raw rows or rollup buckets."""
+    if bucket is not None:
+        if columns:
+            return {"vehicle_id": vehicle_id, "cursor": cursor, "bucket": bucket,
+                    "columns": rows_to_columns(ROLLUP_HISTORY_COLUMNS, rows)}
+        return {"vehicle_id": vehicle_id, "cursor": cursor, "bucket": bucket,
+                "history": [dict(zip(ROLLUP_HISTORY_COLUMNS, r)) for r in rows]}
+
+    if columns:
+        return {"vehicle_id": vehicle_id, "cursor": cursor,
+                "columns": rows_to_columns(HISTORY_COLUMNS, rows)}
 
     history = []
     for r in rows:
@@ -571,10 +1055,223 @@ def api_history():
                 "face_detect": bool(r[15]),
             }
         })
+    return {"vehicle_id": vehicle_id, "cursor": cursor, "history": history}
 
-    return jsonify({"vehicle_id": vehicle_id, "history": history})
+
+@app.route("/api/sparkline")
+def api_sparkline():
+    """
+    SVG sparkline of one vehicle metric (avg line over a min..max band).
+    Query params:
+      - vehicle_id (required)
+      - metric (optional, default speed) → speed | distance | cpu_temp
+      - seconds (optional, default 3600) → window; raw rows up to
+        RAW_HISTORY_MAX_SECONDS, minute / hour rollups beyond
+      - width, height (optional) → image size in px
+    Cached per vehicle, metric, window and size until the vehicle reports
+    new data; revalidated with ETag.
+    """
+    vehicle_id = request.args.get("vehicle_id")
+    if not vehicle_id:
+        return jsonify({"error": "vehicle_id is required"}), 400
+    metric = request.args.get("metric", "speed")
+    if metric not in SPARKLINE_METRICS:
+        return jsonify({"error": "metric must be one of: %s" % ", ".join(SPARKLINE_METRICS)}), 400
+    secs = request.args.get("seconds", default=SPARKLINE_DEFAULT_SECONDS, type=int)
+    if secs <= 0:
+        secs = SPARKLINE_DEFAULT_SECONDS
+    secs = min(secs, HISTORY_MAX_SECONDS)
+    width = max(40, min(request.args.get("width", default=SPARKLINE_WIDTH, type=int), 1200))
+    height = max(16, min(request.args.get("height", default=SPARKLINE_HEIGHT, type=int), 400))
+
+    key = (vehicle_id, metric, secs, width, height)
+    try:
+        _, _, vehicles = cached_vehicles()
+        latest = next((v["ts"] for v in vehicles if v["vehicle_id"] == vehicle_id), None)
+        etag, svg = sparkline_cache.get(
+            key, latest, lambda: render_sparkline(vehicle_id, metric, secs, width, height))
+    except Exception as e:
+        print("PostgreSQL /api/sparkline error:", e)
+        return jsonify({"error": "database unavailable"}), 503
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(svg, mimetype="image/svg+xml")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "max-age=%d" % SPARKLINE_MIN_AGE
+    return resp
+
+
+def render_sparkline(vehicle_id, metric, secs, width, height):
+    """(etag, svg) for api_sparkline, queried at about SPARKLINE_POINTS buckets."""
+    if secs <= RAW_HISTORY_MAX_SECONDS:
+        table, bucket = "vehicle_telemetry", 1
+    elif secs <= MINUTE_HISTORY_MAX_SECONDS:
+        table, bucket = ROLLUP_TABLES[0]
+    else:
+        table, bucket = ROLLUP_TABLES[1]
+    step = bucket * max(1, -(-secs // (SPARKLINE_POINTS * bucket)))
+    end = time.time()
+    start = end - secs
+    with server_timing("db"), pg_pool.connection() as conn:
+        points = fetch_sparkline(conn.cursor(), vehicle_id, metric, table, start // step * step, step)
+    svg = render_svg(points, start, end, step, width=width, height=height,
+                     color=METRIC_COLORS.get(metric, DEFAULT_COLOR),
+                     title="%s %s" % (vehicle_id, metric))
+    return hashlib.sha1(svg.encode()).hexdigest()[:20], svg
+
+
+@app.route("/api/fleet/summary")
+def api_fleet_summary():
+    """
+    Fleet totals from the rollup tables (grouped SQL, no per-row work).
+    Query params:
+      - seconds (optional, default 86400) → window; up to
+        MINUTE_HISTORY_MAX_SECONDS uses minute rollups, longer ones hourly
+      - group_by (optional, default "vehicle") → vehicle | hour | none
+    Per group: utilisation (share of samples moving), travel-weighted
+    utilisation (share of the fleet's travel), seconds in each mode,
+    obstacle events per hour and CPU temperature; plus the fleet's thermal
+    outliers.
+    """
+    secs = request.args.get("seconds", default=86400, type=int)
+    if secs <= 0:
+        secs = 86400
+    secs = min(secs, HISTORY_MAX_SECONDS)
+    group_by = request.args.get("group_by", "vehicle")
+    if group_by not in SUMMARY_GROUPS:
+        return jsonify({"error": "group_by must be one of: %s" % ", ".join(SUMMARY_GROUPS)}), 400
+
+    table, bucket = ROLLUP_TABLES[0] if secs <= MINUTE_HISTORY_MAX_SECONDS else ROLLUP_TABLES[1]
+    cutoff = (time.time() - secs) // bucket * bucket
+    try:
+        with server_timing("db"), pg_pool.connection() as conn:
+            cur = conn.cursor()
+            groups = fleet_summary(cur, table, cutoff, group_by)
+            outliers = thermal_outliers(cur, table, cutoff, THERMAL_OUTLIER_Z)
+    except Exception as e:
+        print("PostgreSQL /api/fleet/summary error:", e)
+        return jsonify({"error": "database unavailable"}), 503
+
+    total_travel = sum(grp["travel"] or 0.0 for grp in groups)
+    summary = []
+    for grp in groups:
+        samples = grp["samples"] or 0
+        hours = samples * SAMPLE_SECONDS / 3600.0
+        moving = grp["moving"] or 0.0
+        summary.append({
+            "key": grp["key"],
+            "vehicles": grp["vehicles"],
+            "hours": round(hours, 3),
+            "utilisation": round(moving / samples, 4) if samples else None,
+            "travel": round(grp["travel"] or 0.0, 1),
+            "travel_share": round((grp["travel"] or 0.0) / total_travel, 4) if total_travel else None,
+            "mode_seconds": {m: round((grp[m] or 0.0) * SAMPLE_SECONDS) for m in SUMMARY_MODES},
+            "obstacle_events": grp["obstacle_events"] or 0,
+            "obstacle_events_per_hour": round((grp["obstacle_events"] or 0) / hours, 3) if hours else None,
+            "cpu_temp_avg": round(grp["cpu_temp_avg"], 2) if grp["cpu_temp_avg"] is not None else None,
+            "cpu_temp_max": grp["cpu_temp_max"],
+        })
+
+    with server_timing("json"):
+        return jsonify({
+            "seconds": secs,
+            "bucket": bucket,
+            "group_by": group_by,
+            "groups": summary,
+            "thermal_outliers": [
+                {"vehicle_id": vid, "cpu_temp_avg": round(avg, 2), "cpu_temp_max": mx, "z": round(z, 2)}
+                for vid, avg, mx, z in outliers
+            ],
+        })
+
+
+@app.route("/api/events")
+def api_events():
+    """
+    Extracted telemetry events, newest first.
+    Query params:
+      - vehicle_id (optional) → one vehicle, default the whole fleet
+      - kind (optional) → e.g. obstacle_enter, mode_on, line_lost, cpu_hot
+      - seconds (optional, default 86400) → window
+      - limit (optional, default 500, at most EVENTS_MAX_LIMIT)
+    "counts" holds the number of events per kind in the window, before
+    the limit.
+    """
+    secs = request.args.get("seconds", default=EVENTS_DEFAULT_SECONDS, type=int)
+    if secs <= 0:
+        secs = EVENTS_DEFAULT_SECONDS
+    secs = min(secs, HISTORY_MAX_SECONDS)
+    limit = request.args.get("limit", default=500, type=int)
+    limit = max(1, min(limit, EVENTS_MAX_LIMIT))
+    vehicle_id = request.args.get("vehicle_id") or None
+    kind = request.args.get("kind") or None
+
+    try:
+        with server_timing("db"), pg_pool.connection() as conn:
+            rows, counts = fetch_events(conn.cursor(), time.time() - secs,
+                                        vehicle_id=vehicle_id, kind=kind, limit=limit)
+    except Exception as e:
+        print("PostgreSQL /api/events error:", e)
+        return jsonify({"error": "database unavailable"}), 503
+
+    with server_timing("json"):
+        return jsonify({
+            "seconds": secs,
+            "vehicle_id": vehicle_id,
+            "kind": kind,
+            "counts": counts,
+            "events": [dict(zip(EVENT_COLUMNS, r)) for r in rows],
+        })
+
+
+@app.route("/api/db/stats")
+def api_db_stats():
+    """Connection pool counters (acquisition latency, waits, timeouts)."""
+    return jsonify(pg_pool.stats())
+
+
+def rollup_refresh_loop():
+    while True:
+        try:
+            with pg_pool.connection() as conn:
+                refresh_rollups(conn, time.time() - MINUTE_ROLLUP_RETENTION_SECONDS)
+        except Exception as e:
+            print("Rollup refresh error:", e)
+        time.sleep(ROLLUP_REFRESH_INTERVAL)
+
+
+def partition_maintenance_loop():
+    while True:
+        try:
+            with pg_pool.connection() as conn:
+                created, dropped = maintain_partitions(
+                    conn, TELEMETRY_RETENTION_DAYS, days_ahead=PARTITION_DAYS_AHEAD)
+                minutes = prune_rows(conn, "vehicle_telemetry_1m", MINUTE_ROLLUP_RETENTION_SECONDS)
+                events = 0
+                if EVENT_RETENTION_DAYS is not None:
+                    events = prune_rows(conn, "vehicle_events", EVENT_RETENTION_DAYS * 86400)
+            if created or dropped:
+                print("vehicle_telemetry partitions: %d created, %d dropped" % (created, dropped))
+            if minutes:
+                print("vehicle_telemetry_1m: %d old minutes pruned" % minutes)
+            if events:
+                print("vehicle_events: %d old events pruned" % events)
+        except Exception as e:
+            print("Partition maintenance error:", e)
+        time.sleep(PARTITION_CHECK_INTERVAL)
 
 
 if __name__ == "__main__":
+    try:
+        with pg_pool.connection() as conn:
+            ensure_schema(conn, days_ahead=PARTITION_DAYS_AHEAD)
+    except Exception as e:
+        print("PostgreSQL schema setup failed:", e)
+    threading.Thread(target=partition_maintenance_loop, daemon=True).start()
+    threading.Thread(target=rollup_refresh_loop, daemon=True).start()
+    listener.start()
+
     print("IntelliCart central dashboard at http://0.0.0.0:8000")
     app.run(host="0.0.0.0", port=8000, debug=False)
@@ -0,0 +1,729 @@
+"""
+Batch ingest of cart telemetry into the central fleet database.
+
+Carts POST compressed batches of rows to /api/ingest on the central
+dashboard; this module decodes them and loads them into vehicle_telemetry
+with COPY, one transaction per batch. Rows are keyed on (vehicle_id, ts),
+so a batch that is re-sent after a timeout only inserts what is missing.
+
+Accepted bodies:
+  Content-Type      application/x-ndjson (one JSON object per line) or
+                    application/msgpack (a stream of maps, or arrays of maps)
+  Content-Encoding  gzip, zstd or identity
+
+zstd and msgpack are optional extras (pip install zstandard msgpack); the
+gzip + NDJSON path only needs the standard library.
+
+PgPool is the dashboard's process-wide PostgreSQL connection pool.
+"""
+import csv
+import io
+import json
+import re
+import select
+import threading
+import zlib
+from contextlib import contextmanager
+from time import monotonic, time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+from fleet_schema import ROLLUP_COLUMNS, VEHICLE_COLUMNS, latest_upsert_sql, mark_dirty_sql
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Column order of ingested rows (same as the replicator's VEHICLE_COLUMNS)
+INGEST_COLUMNS = VEHICLE_COLUMNS
+
+# Refuse batches that inflate beyond this (guards against zip bombs)
+MAX_BATCH_BYTES = 32 * 1024 * 1024
+
+# vehicle_id is shown on the dashboard, so only hostname-like ids are taken
+VEHICLE_ID_RE = re.compile(r"^[A-Za-z0-9_.:-]{1,64}$")
+TEXT_COLUMNS = ("vehicle_id", "motion", "line_state")
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+# zstd bodies are fed to the decoder in slices this small, so a bomb cannot
+# inflate far past MAX_BATCH_BYTES in one call (4 input bytes can expand to
+# a 128 KiB block)
+ZSTD_FEED_BYTES = 1024
+
+
+def decompress(body, encoding):
+    """
+    Undo the Content-Encoding of a request body: every gzip member / zstd
+    frame in it, concatenated. Raises ValueError.
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip"):
+        try:
+            data = _gunzip(body)
+        except zlib.error as e:
+            raise ValueError("bad gzip body: %s" % e)
+    elif encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd not supported (pip install zstandard)")
+        try:
+            data = _unzstd(body)
+        except zstandard.ZstdError as e:
+            raise ValueError("bad zstd body: %s" % e)
+    else:
+        raise ValueError("unsupported Content-Encoding: %s" % encoding)
+
+    if len(data) > MAX_BATCH_BYTES:
+        raise ValueError("batch larger than %d bytes" % MAX_BATCH_BYTES)
+    return data
+
+
+def _gunzip(body):
+    """All members of a gzip body, stopping once past MAX_BATCH_BYTES."""
+    chunks, size = [], 0
+    while body and size <= MAX_BATCH_BYTES:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks.append(d.decompress(body, MAX_BATCH_BYTES + 1 - size))
+        size += len(chunks[-1])
+        if size > MAX_BATCH_BYTES:
+            break
+        if not d.eof:
+            raise ValueError("truncated gzip body")
+        body = d.unused_data
+    return b"".join(chunks)
+
+
+def _unzstd(body):
+    """All frames of a zstd body, stopping once past MAX_BATCH_BYTES."""
+    body = memoryview(body)
+    chunks, size = [], 0
+    d, started = zstandard.ZstdDecompressor().decompressobj(), False
+    pos = 0
+    while pos < len(body) and size <= MAX_BATCH_BYTES:
+        piece = body[pos:pos + ZSTD_FEED_BYTES]
+        pos += len(piece)
+        chunks.append(d.decompress(piece))
+        size += len(chunks[-1])
+        started = True
+        if d.eof:
+            # The next frame starts in the unused tail of this slice
+            pos -= len(d.unused_data)
+            d, started = zstandard.ZstdDecompressor().decompressobj(), False
+    if started and size <= MAX_BATCH_BYTES:
+        raise ValueError("truncated zstd body")
+    return b"".join(chunks)
+
+
+def _records(data, content_type):
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise ValueError("msgpack not supported (pip install msgpack)")
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(data)
+        try:
+            for obj in unpacker:
+                if isinstance(obj, list):
+                    yield from obj
+                else:
+                    yield obj
+        except Exception as e:
+            raise ValueError("bad msgpack body: %s" % e)
+    elif content_type in NDJSON_TYPES:
+        for line in data.splitlines():
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                raise ValueError("bad JSON line: %s" % e)
+            if isinstance(obj, list):
+                yield from obj
+            else:
+                yield obj
+    else:
+        raise ValueError("unsupported Content-Type: %s" % content_type)
+
+
+def decode_batch(body, encoding, content_type):
+    """
+    Request body → list of row tuples in INGEST_COLUMNS order.
+    Missing columns become NULL; rows without ts / vehicle_id, with a
+    malformed vehicle_id or with non-numeric values in numeric columns are
+    rejected (ValueError).
+    """
+    rows = []
+    for rec in _records(decompress(body, encoding), (content_type or "").lower()):
+        if not isinstance(rec, dict):
+            raise ValueError("row %d is not an object" % len(rows))
+        if rec.get("ts") is None or not rec.get("vehicle_id"):
+            raise ValueError("row %d is missing ts or vehicle_id" % len(rows))
+        row = tuple(rec.get(c) for c in INGEST_COLUMNS)
+        for name, value in zip(INGEST_COLUMNS, row):
+            if value is None:
+                continue
+            if name in TEXT_COLUMNS:
+                ok = isinstance(value, str) and (name != "vehicle_id" or VEHICLE_ID_RE.match(value))
+            else:
+                ok = isinstance(value, (int, float))
+            if not ok:
+                raise ValueError("row %d has a bad %s: %r" % (len(rows), name, value))
+        rows.append(row)
+    return rows
+
+
+def _copy_buffer(rows):
+    """Rows → CSV text for COPY (None → unquoted empty field → NULL)."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    return buf
+
+
+def copy_rows(cur, rows, table="vehicle_telemetry"):
+    """Bulk-load rows (INGEST_COLUMNS order) into `table` with COPY."""
+    cur.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)"
+                    % (table, ", ".join(INGEST_COLUMNS)), _copy_buffer(rows))
+
+
+# Per-session staging table: COPY cannot skip conflicting rows itself
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS ingest_staging
+ON COMMIT DELETE ROWS AS
+SELECT %s FROM vehicle_telemetry WITH NO DATA
+""" % ", ".join(INGEST_COLUMNS)
+
+MERGE_SQL = """
+INSERT INTO vehicle_telemetry (%(cols)s)
+SELECT %(cols)s FROM ingest_staging
+ON CONFLICT (vehicle_id, ts) DO NOTHING
+""" % {"cols": ", ".join(INGEST_COLUMNS)}
+
+LATEST_SQL = latest_upsert_sql("ingest_staging")
+
+DIRTY_SQL = mark_dirty_sql("ingest_staging")
+
+# Fired at commit. The payload stays empty: listeners only need to know
+# that something changed, and payloads are limited to 8000 bytes
+NOTIFY_CHANNEL = "vehicle_latest"
+NOTIFY_SQL = "SELECT pg_notify('%s', '')" % NOTIFY_CHANNEL
+
+
+EVENTS_INSERT_SQL = """
+INSERT INTO vehicle_events (vehicle_id, ts, kind, detail, value) VALUES %s
+ON CONFLICT DO NOTHING
+"""
+
+
+def ingest_rows(conn, rows, events=()):
+    """
+    Write one decoded batch in a single transaction: COPY into a staging
+    table, then insert the rows whose (vehicle_id, ts) is new and move
+    each vehicle's newest row into vehicle_latest and queue the touched
+    minutes for a rollup refresh. `events` (telemetry_events tuples) are
+    stored alongside; re-sent ones are ignored. Listeners on
+    NOTIFY_CHANNEL are notified once it commits. Returns
+    the number inserted; the rest were duplicates.
+    """
+    if not rows:
+        return 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute(STAGING_SQL)
+            copy_rows(cur, rows, table="ingest_staging")
+            cur.execute(MERGE_SQL)
+            inserted = cur.rowcount
+            cur.execute(LATEST_SQL)
+            if events:
+                execute_values(cur, EVENTS_INSERT_SQL, events)
+            if inserted:
+                cur.execute(DIRTY_SQL)
+                cur.execute(NOTIFY_SQL)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted
+
+
+# --- rollups -------------------------------------------------------------
+
+def _rollup_update(cols):
+    return ", ".join("%s = EXCLUDED.%s" % (c, c) for c in cols)
+
+
+# Dirty minutes claimed (and rolled up) per transaction by refresh_rollups()
+ROLLUP_CHUNK_MINUTES = 5000
+
+# Takes up to %s dirty minutes off the queue; minutes another refresh
+# already holds are left to it
+CLAIM_DIRTY_SQL = """
+DELETE FROM vehicle_rollup_dirty
+WHERE (vehicle_id, ts) IN (
+    SELECT vehicle_id, ts FROM vehicle_rollup_dirty
+    ORDER BY vehicle_id, ts
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING vehicle_id, ts
+"""
+
+# Recomputes the claimed minutes (parallel vehicle_id / ts arrays) from the
+# raw rows. Consecutive minutes are read as one run, starting one minute
+# early so LAG sees the sample before it when counting obstacle
+# on-transitions. Returns the minutes written.
+MINUTE_REFRESH_SQL = """
+WITH dirty (vehicle_id, ts) AS (
+    SELECT * FROM unnest(%%s::text[], %%s::double precision[])
+), runs AS (
+    SELECT vehicle_id, min(ts) AS lo, max(ts) + 60 AS hi
+    FROM (SELECT vehicle_id, ts,
+                 ts - 60 * row_number() OVER (PARTITION BY vehicle_id ORDER BY ts) AS run
+          FROM dirty) d
+    GROUP BY vehicle_id, run
+), raw AS (
+    SELECT t.*, floor(t.ts / 60) * 60 AS bucket,
+           t.obstacle AND NOT coalesce(
+               lag(t.obstacle) OVER (PARTITION BY t.vehicle_id, s.lo ORDER BY t.ts), false) AS obstacle_on
+    FROM vehicle_telemetry t
+    JOIN runs s ON t.vehicle_id = s.vehicle_id AND t.ts >= s.lo - 60 AND t.ts < s.hi
+)
+INSERT INTO vehicle_telemetry_1m (vehicle_id, ts, %(cols)s)
+SELECT r.vehicle_id, r.bucket, count(*),
+       avg(speed), min(speed), max(speed),
+       avg(distance), min(distance), max(distance),
+       avg(cpu_temp), min(cpu_temp), max(cpu_temp),
+       count(*) FILTER (WHERE obstacle), count(*) FILTER (WHERE obstacle_on),
+       avg((motion IS DISTINCT FROM 'stop')::int),
+       avg(line_track::int), avg(avoid_obstacles::int), avg(color_follow::int),
+       avg(color_detect::int), avg(face_detect::int)
+FROM raw r
+JOIN dirty d ON d.vehicle_id = r.vehicle_id AND d.ts = r.bucket
+GROUP BY r.vehicle_id, r.bucket
+ON CONFLICT (vehicle_id, ts) DO UPDATE SET %(update)s
+RETURNING vehicle_id, ts
+""" % {"cols": ", ".join(ROLLUP_COLUMNS), "update": _rollup_update(ROLLUP_COLUMNS)}
+
+
+def _merge_select(prefix=""):
+    """Aggregates merging rollup rows: n-weighted means, min/max, sums."""
+    exprs = ["sum(%sn)" % prefix]
+    for c in ROLLUP_COLUMNS[1:]:
+        if c.endswith("_min"):
+            exprs.append("min(%s%s)" % (prefix, c))
+        elif c.endswith("_max"):
+            exprs.append("max(%s%s)" % (prefix, c))
+        elif c in ("obstacle", "obstacle_events"):
+            exprs.append("sum(%s%s)" % (prefix, c))
+        else:
+            exprs.append("sum(%s%s * %sn) / sum(%sn)" % (prefix, c, prefix, prefix))
+    return ", ".join(exprs)
+
+
+# Dirty minutes in an hour whose minute rollups may already be pruned queue
+# the whole hour, so it is rebuilt from raw rows rather than from the one
+# minute that was re-created
+EXPAND_DIRTY_SQL = """
+INSERT INTO vehicle_rollup_dirty (vehicle_id, ts)
+SELECT DISTINCT d.vehicle_id, floor(d.ts / 3600) * 3600 + m.i * 60
+FROM vehicle_rollup_dirty d CROSS JOIN generate_series(0, 59) AS m(i)
+WHERE floor(d.ts / 3600) * 3600 < %s
+ON CONFLICT DO NOTHING
+"""
+
+
+HOUR_REFRESH_SQL = """
+WITH dirty (vehicle_id, ts) AS (
+    SELECT DISTINCT * FROM unnest(%%s::text[], %%s::double precision[])
+)
+INSERT INTO vehicle_telemetry_1h (vehicle_id, ts, %(cols)s)
+SELECT m.vehicle_id, d.ts, %(merge)s
+FROM vehicle_telemetry_1m m
+JOIN dirty d ON d.vehicle_id = m.vehicle_id AND m.ts >= d.ts AND m.ts < d.ts + 3600
+GROUP BY m.vehicle_id, d.ts
+ON CONFLICT (vehicle_id, ts) DO UPDATE SET %(update)s
+""" % {"cols": ", ".join(ROLLUP_COLUMNS), "merge": _merge_select("m."),
+       "update": _rollup_update(ROLLUP_COLUMNS)}
+
+
+def refresh_rollups(conn, minute_cutoff=None, chunk=ROLLUP_CHUNK_MINUTES):
+    """
+    Recompute the minute rollups of every dirty minute and the hours that
+    contain them, `chunk` minutes per transaction, so a large backlog (the
+    backfill queued by ensure_schema) never holds locks over all of history.
+    `minute_cutoff` is the oldest ts still kept in vehicle_telemetry_1m
+    (None: all of it). Returns (minutes, hours) refreshed.
+    """
+    total_minutes = total_hours = 0
+    try:
+        if minute_cutoff is not None:
+            with conn.cursor() as cur:
+                cur.execute(EXPAND_DIRTY_SQL, (minute_cutoff,))
+            conn.commit()
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(CLAIM_DIRTY_SQL, (chunk,))
+                claimed = cur.fetchall()
+                if not claimed:
+                    break
+                vids, starts = zip(*claimed)
+                cur.execute(MINUTE_REFRESH_SQL, (list(vids), list(starts)))
+                minutes = cur.fetchall()
+                hours = {(vid, ts // 3600 * 3600) for vid, ts in minutes}
+                if hours:
+                    vids, starts = zip(*hours)
+                    cur.execute(HOUR_REFRESH_SQL, (list(vids), list(starts)))
+            conn.commit()
+            total_minutes += len(minutes)
+            total_hours += len(hours)
+            if len(claimed) < chunk:
+                break
+    except Exception:
+        conn.rollback()
+        raise
+    return total_minutes, total_hours
+
+
+# Rollup columns as returned by fetch_rollup (chart-friendly names: the
+# means keep the raw column name, flags become fractions of samples)
+ROLLUP_HISTORY_COLUMNS = (
+    "ts", "n",
+    "speed", "speed_min", "speed_max",
+    "distance", "distance_min", "distance_max",
+    "cpu_temp", "cpu_temp_min", "cpu_temp_max",
+    "obstacle", "obstacle_events",
+    "moving", "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+
+def fetch_rollup(cur, vehicle_id, table, cutoff, after):
+    """Rollup rows of one vehicle with ts >= cutoff and ts > after, oldest first."""
+    cur.execute("""
+        SELECT ts, n,
+               speed_avg, speed_min, speed_max,
+               distance_avg, distance_min, distance_max,
+               cpu_temp_avg, cpu_temp_min, cpu_temp_max,
+               obstacle::double precision / n, obstacle_events,
+               moving, line_track, avoid_obstacles, color_follow, color_detect, face_detect
+        FROM %s
+        WHERE vehicle_id = %%s AND ts >= %%s AND ts > %%s
+        ORDER BY ts ASC
+    """ % table, (vehicle_id, cutoff, after))
+    return cur.fetchall()
+
+
+# Metrics with avg/min/max rollup columns, drawable as sparklines
+SPARKLINE_METRICS = ("speed", "distance", "cpu_temp")
+
+
+def fetch_sparkline(cur, vehicle_id, metric, table, cutoff, step):
+    """
+    (ts, avg, min, max) of `metric` for one vehicle in `step`-second
+    buckets from ts >= cutoff, oldest first. `table` is vehicle_telemetry
+    or one of the rollup tables (re-aggregated, weighted by n).
+    """
+    if metric not in SPARKLINE_METRICS:
+        raise ValueError("unknown metric %r" % metric)
+    if table == "vehicle_telemetry":
+        cols = "avg({0}), min({0}), max({0})".format(metric)
+    else:
+        cols = "sum({0}_avg * n) / sum(n), min({0}_min), max({0}_max)".format(metric)
+    cur.execute("""
+        SELECT floor(ts / %%s) * %%s AS b, %s
+        FROM %s
+        WHERE vehicle_id = %%s AND ts >= %%s
+        GROUP BY b
+        ORDER BY b ASC
+    """ % (cols, table), (step, step, vehicle_id, cutoff))
+    return cur.fetchall()
+
+
+# --- fleet analytics -----------------------------------------------------
+
+# group_by -> SQL key expression for fleet_summary
+SUMMARY_GROUPS = {
+    "vehicle": "vehicle_id",
+    "hour": "floor(ts / 3600) * 3600",
+    "none": "NULL",
+}
+
+SUMMARY_MODES = ("moving", "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect")
+
+SUMMARY_COLUMNS = (
+    "key", "vehicles", "samples", "travel", "obstacle_events",
+    "cpu_temp_avg", "cpu_temp_max",
+) + SUMMARY_MODES
+
+
+def fleet_summary(cur, table, cutoff, group_by):
+    """
+    One grouped query over a rollup table: per group the vehicle count,
+    samples, travel (sum of speed x samples), obstacle on-transitions, mean
+    / max cpu_temp and the number of samples spent in each of
+    SUMMARY_MODES. Returns dicts keyed by SUMMARY_COLUMNS.
+    """
+    cur.execute("""
+        SELECT %(key)s AS key, count(DISTINCT vehicle_id), sum(n),
+               sum(speed_avg * n), sum(obstacle_events),
+               sum(cpu_temp_avg * n) / sum(n), max(cpu_temp_max),
+               %(modes)s
+        FROM %(table)s
+        WHERE ts >= %%s
+        GROUP BY 1
+        ORDER BY 1
+    """ % {"key": SUMMARY_GROUPS[group_by], "table": table,
+           "modes": ", ".join("sum(%s * n)" % m for m in SUMMARY_MODES)}, (cutoff,))
+    return [dict(zip(SUMMARY_COLUMNS, r)) for r in cur.fetchall()]
+
+
+def thermal_outliers(cur, table, cutoff, min_z):
+    """
+    Vehicles whose mean cpu_temp over the window is at least `min_z`
+    standard deviations above the fleet mean, hottest first:
+    (vehicle_id, cpu_temp_avg, cpu_temp_max, z).
+    """
+    cur.execute("""
+        WITH per_vehicle AS (
+            SELECT vehicle_id, sum(cpu_temp_avg * n) / sum(n) AS cpu_avg,
+                   max(cpu_temp_max) AS cpu_max
+            FROM %s
+            WHERE ts >= %%s AND cpu_temp_avg IS NOT NULL
+            GROUP BY vehicle_id
+        ), scored AS (
+            SELECT vehicle_id, cpu_avg, cpu_max,
+                   (cpu_avg - avg(cpu_avg) OVER ()) / nullif(stddev_pop(cpu_avg) OVER (), 0) AS z
+            FROM per_vehicle
+        )
+        SELECT vehicle_id, cpu_avg, cpu_max, z FROM scored
+        WHERE z >= %%s
+        ORDER BY z DESC
+    """ % table, (cutoff, min_z))
+    return cur.fetchall()
+
+def fetch_events(cur, since, vehicle_id=None, kind=None, limit=500):
+    """
+    Events with ts >= since, newest first, optionally for one vehicle
+    and/or kind, plus the per-kind counts over the same filter:
+    (rows, {kind: count}).
+    """
+    where, params = ["ts >= %s"], [since]
+    if vehicle_id:
+        where.append("vehicle_id = %s")
+        params.append(vehicle_id)
+    if kind:
+        where.append("kind = %s")
+        params.append(kind)
+    where = " AND ".join(where)
+
+    cur.execute("""
+        SELECT vehicle_id, ts, kind, detail, value FROM vehicle_events
+        WHERE %s
+        ORDER BY ts DESC
+        LIMIT %%s
+    """ % where, params + [limit])
+    rows = cur.fetchall()
+    cur.execute("SELECT kind, count(*) FROM vehicle_events WHERE %s GROUP BY kind" % where, params)
+    return rows, dict(cur.fetchall())
+
+
+class PgPool:
+    """
+    Process-wide pool of PostgreSQL connections for the dashboard's request
+    threads.
+
+    At most `maxconn` connections are open; when all are checked out,
+    `connection()` waits up to `acquire_timeout` seconds instead of failing
+    straight away. A connection that sat idle for more than `check_after`
+    seconds is pinged before use and replaced if the server dropped it.
+    The pool itself is created on first use, so the dashboard starts even
+    while PostgreSQL is down.
+    """
+
+    def __init__(self, pg_config, minconn=1, maxconn=10, acquire_timeout=5.0, check_after=30.0):
+        self.pg_config = pg_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.check_after = check_after
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "acquired": 0,
+            "waited": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "in_use": 0,
+            "acquire_ms_total": 0.0,
+            "acquire_ms_max": 0.0,
+        }
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self.pg_config)
+            return self._pool
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self._last_used.get(id(conn))
+        if last is None or time() - last < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        if not self._healthy(conn):
+            self._last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+            with self._stats_lock:
+                self._stats["discarded"] += 1
+            conn = pool.getconn()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; any open transaction is rolled back on return."""
+        start = monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["waited"] += 1
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                with self._stats_lock:
+                    self._stats["timeouts"] += 1
+                raise PoolError("no PostgreSQL connection free after %.1f s" % self.acquire_timeout)
+        try:
+            conn = self._checkout()
+            ms = (monotonic() - start) * 1000.0
+            with self._stats_lock:
+                self._stats["acquired"] += 1
+                self._stats["in_use"] += 1
+                self._stats["acquire_ms_total"] += ms
+                self._stats["acquire_ms_max"] = max(self._stats["acquire_ms_max"], ms)
+
+            broken = False
+            try:
+                yield conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                broken = True
+                raise
+            finally:
+                if not broken and not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        broken = True
+                broken = broken or bool(conn.closed)
+                if broken:
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time()
+                self._pool.putconn(conn, close=broken)
+                with self._stats_lock:
+                    self._stats["in_use"] -= 1
+                    if broken:
+                        self._stats["discarded"] += 1
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["min"] = self.minconn
+        s["max"] = self.maxconn
+        s["acquire_ms_avg"] = s["acquire_ms_total"] / s["acquired"] if s["acquired"] else 0.0
+        del s["acquire_ms_total"]
+        return s
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+# libpq keepalive settings for the LISTEN connection, which is otherwise idle
+LISTEN_KEEPALIVES = {"keepalives": 1, "keepalives_idle": 10,
+                     "keepalives_interval": 5, "keepalives_count": 3}
+
+
+class NotifyListener:
+    """
+    Background LISTEN on NOTIFY_CHANNEL over a dedicated connection.
+    `callback()` runs on this thread after every batch of notifications,
+    and after every (re)connect, since notifications sent while
+    disconnected are lost. `connected` tells callers whether they can
+    rely on it or must poll. TCP keepalives notice a dead server within
+    about half a minute; it then reconnects with backoff.
+    """
+
+    def __init__(self, pg_config, callback, channel=NOTIFY_CHANNEL, max_backoff=60.0):
+        self.pg_config = pg_config
+        self.callback = callback
+        self.channel = channel
+        self.max_backoff = max_backoff
+        self.connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="pg-listen", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**dict(LISTEN_KEEPALIVES, **self.pg_config))
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute("LISTEN %s" % self.channel)
+                self.connected = True
+                backoff = 1.0
+                self.callback()
+                # Wake up every few seconds to notice close()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5.0)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            del conn.notifies[:]
+                            self.callback()
+            except Exception as e:
+                if self.connected or backoff == 1.0:
+                    print("PostgreSQL LISTEN error (will retry):", e)
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(self.max_backoff, backoff * 2)
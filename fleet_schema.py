@@ -0,0 +1,343 @@
+"""
+Schema of the central fleet database (PostgreSQL).
+
+Shared by central_dashboard.py and the seeding / load tools so they all
+create the same tables.
+"""
+from datetime import datetime, timedelta, timezone
+from time import time
+
+# vehicle_telemetry columns, in the order carts send them
+VEHICLE_COLUMNS = (
+    "ts", "vehicle_id", "speed", "raw_speed", "distance",
+    "line_l", "line_m", "line_r", "motion", "line_state", "obstacle", "cpu_temp",
+    "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+# History, partitioned by day on ts (UTC). The (vehicle_id, ts) primary key
+# is also the index behind /api/history and makes re-sent rows conflicts.
+VEHICLE_TELEMETRY_SQL = """
+CREATE TABLE vehicle_telemetry (
+  ts DOUBLE PRECISION NOT NULL,
+  vehicle_id TEXT NOT NULL,
+  speed DOUBLE PRECISION,
+  raw_speed DOUBLE PRECISION,
+  distance DOUBLE PRECISION,
+  line_l INTEGER,
+  line_m INTEGER,
+  line_r INTEGER,
+  motion TEXT,
+  line_state TEXT,
+  obstacle BOOLEAN,
+  cpu_temp DOUBLE PRECISION,
+  line_track BOOLEAN,
+  avoid_obstacles BOOLEAN,
+  color_follow BOOLEAN,
+  color_detect BOOLEAN,
+  face_detect BOOLEAN,
+  PRIMARY KEY (vehicle_id, ts)
+) PARTITION BY RANGE (ts)
+"""
+
+# Catches rows outside the prepared days (e.g. a cart with a wrong clock)
+DEFAULT_PARTITION = "vehicle_telemetry_default"
+
+PARTITION_PREFIX = "vehicle_telemetry_p"
+
+# Newest row per vehicle, upserted on ingest so /api/vehicles does not scan
+# the history table
+VEHICLE_LATEST_SQL = """
+CREATE TABLE IF NOT EXISTS vehicle_latest (
+  vehicle_id TEXT PRIMARY KEY,
+  ts DOUBLE PRECISION NOT NULL,
+  speed DOUBLE PRECISION,
+  raw_speed DOUBLE PRECISION,
+  distance DOUBLE PRECISION,
+  line_l INTEGER,
+  line_m INTEGER,
+  line_r INTEGER,
+  motion TEXT,
+  line_state TEXT,
+  obstacle BOOLEAN,
+  cpu_temp DOUBLE PRECISION,
+  line_track BOOLEAN,
+  avoid_obstacles BOOLEAN,
+  color_follow BOOLEAN,
+  color_detect BOOLEAN,
+  face_detect BOOLEAN
+)
+"""
+
+
+def latest_upsert_sql(source):
+    """
+    INSERT ... SELECT that moves the newest row per vehicle in `source` (a
+    table or subquery with VEHICLE_COLUMNS) into vehicle_latest, leaving
+    vehicles whose stored row is newer alone.
+    """
+    cols = ", ".join(VEHICLE_COLUMNS)
+    updates = ", ".join("%s = EXCLUDED.%s" % (c, c) for c in VEHICLE_COLUMNS if c != "vehicle_id")
+    return """
+        INSERT INTO vehicle_latest (%s)
+        SELECT DISTINCT ON (vehicle_id) %s FROM %s AS src
+        ORDER BY vehicle_id, ts DESC
+        ON CONFLICT (vehicle_id) DO UPDATE SET %s
+        WHERE EXCLUDED.ts > vehicle_latest.ts
+    """ % (cols, cols, source, updates)
+
+
+def rebuild_latest(conn):
+    """Refresh vehicle_latest from the full history (setup / bulk loads)."""
+    cur = conn.cursor()
+    cur.execute(latest_upsert_sql("vehicle_telemetry"))
+    # Dashboards cache vehicle_latest until told it changed
+    cur.execute("SELECT pg_notify('vehicle_latest', '')")
+    conn.commit()
+    cur.close()
+
+
+# Per-vehicle rollups of vehicle_telemetry, keyed on the bucket start ts.
+# Averages and duty cycles (fraction of samples with the flag set) are
+# weighted by n when minutes are merged into hours; obstacle counts
+# samples and obstacle_events counts off -> on transitions.
+ROLLUP_TABLES = (("vehicle_telemetry_1m", 60), ("vehicle_telemetry_1h", 3600))
+
+ROLLUP_COLUMNS = (
+    "n",
+    "speed_avg", "speed_min", "speed_max",
+    "distance_avg", "distance_min", "distance_max",
+    "cpu_temp_avg", "cpu_temp_min", "cpu_temp_max",
+    "obstacle", "obstacle_events",
+    "moving", "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+ROLLUP_SQL = """
+CREATE TABLE IF NOT EXISTS %s (
+  vehicle_id TEXT NOT NULL,
+  ts DOUBLE PRECISION NOT NULL,
+  n INTEGER NOT NULL,
+  speed_avg DOUBLE PRECISION,
+  speed_min DOUBLE PRECISION,
+  speed_max DOUBLE PRECISION,
+  distance_avg DOUBLE PRECISION,
+  distance_min DOUBLE PRECISION,
+  distance_max DOUBLE PRECISION,
+  cpu_temp_avg DOUBLE PRECISION,
+  cpu_temp_min DOUBLE PRECISION,
+  cpu_temp_max DOUBLE PRECISION,
+  obstacle INTEGER,
+  obstacle_events INTEGER,
+  moving DOUBLE PRECISION,
+  line_track DOUBLE PRECISION,
+  avoid_obstacles DOUBLE PRECISION,
+  color_follow DOUBLE PRECISION,
+  color_detect DOUBLE PRECISION,
+  face_detect DOUBLE PRECISION,
+  PRIMARY KEY (vehicle_id, ts)
+)
+"""
+
+# Minutes whose rollups are stale, filled by ingest and drained by
+# fleet_db.refresh_rollups()
+ROLLUP_DIRTY_SQL = """
+CREATE TABLE IF NOT EXISTS vehicle_rollup_dirty (
+  vehicle_id TEXT NOT NULL,
+  ts DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (vehicle_id, ts)
+)
+"""
+
+
+# Transitions extracted by telemetry_events.EventDetector at ingest. The
+# key covers the per-vehicle timeline; (kind, ts) serves fleet-wide queries
+# such as "all obstacle_enter events this shift", (ts) unfiltered ones and
+# retention.
+VEHICLE_EVENTS_SQL = """
+CREATE TABLE IF NOT EXISTS vehicle_events (
+  vehicle_id TEXT NOT NULL,
+  ts DOUBLE PRECISION NOT NULL,
+  kind TEXT NOT NULL,
+  detail TEXT NOT NULL DEFAULT '',
+  value DOUBLE PRECISION,
+  PRIMARY KEY (vehicle_id, ts, kind, detail)
+);
+CREATE INDEX IF NOT EXISTS vehicle_events_kind_ts ON vehicle_events (kind, ts);
+CREATE INDEX IF NOT EXISTS vehicle_events_ts ON vehicle_events (ts)
+"""
+
+
+def mark_dirty_sql(source):
+    """INSERT ... SELECT marking every minute with rows in `source` for refresh."""
+    return """
+        INSERT INTO vehicle_rollup_dirty (vehicle_id, ts)
+        SELECT DISTINCT vehicle_id, floor(ts / 60) * 60 FROM %s AS src
+        ON CONFLICT DO NOTHING
+    """ % source
+
+
+def mark_rollups_dirty(conn, since=None):
+    """Queue history since `since` (default: all of it) for a rollup refresh."""
+    cur = conn.cursor()
+    if since is None:
+        cur.execute(mark_dirty_sql("vehicle_telemetry"))
+    else:
+        cur.execute(mark_dirty_sql("(SELECT vehicle_id, ts FROM vehicle_telemetry WHERE ts >= %s)"),
+                    (since,))
+    conn.commit()
+    cur.close()
+
+
+def _partition_name(day):
+    return PARTITION_PREFIX + day.strftime("%Y%m%d")
+
+
+def _day_start(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+
+
+def _create_partition(cur, day):
+    """
+    Create the partition for one UTC day unless it exists. Rows for that
+    day that already landed in the default partition are moved into it
+    first, since ATTACH refuses to overlap them.
+    """
+    name = _partition_name(day)
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0] is not None:
+        return False
+    lo = day.timestamp()
+    hi = (day + timedelta(days=1)).timestamp()
+    cur.execute("CREATE TABLE %s (LIKE vehicle_telemetry INCLUDING DEFAULTS INCLUDING CONSTRAINTS)" % name)
+    cur.execute("""
+        WITH moved AS (
+            DELETE FROM %s WHERE ts >= %%s AND ts < %%s RETURNING *
+        )
+        INSERT INTO %s SELECT * FROM moved
+    """ % (DEFAULT_PARTITION, name), (lo, hi))
+    cur.execute("ALTER TABLE vehicle_telemetry ATTACH PARTITION %s FOR VALUES FROM (%r) TO (%r)"
+                % (name, lo, hi))
+    return True
+
+
+def _create_partitions(cur, first_ts, last_ts):
+    day = _day_start(first_ts)
+    created = 0
+    while day.timestamp() <= last_ts:
+        created += _create_partition(cur, day)
+        day += timedelta(days=1)
+    return created
+
+
+def ensure_partitions(conn, first_ts, last_ts):
+    """Create the daily partitions covering [first_ts, last_ts] (bulk loads)."""
+    cur = conn.cursor()
+    created = _create_partitions(cur, first_ts, last_ts)
+    conn.commit()
+    cur.close()
+    return created
+
+
+def _migrate_legacy(cur, days_ahead):
+    """
+    Convert a plain vehicle_telemetry table (SERIAL id, no key) into the
+    partitioned layout. Duplicate (vehicle_id, ts) rows keep their oldest
+    copy; rows without ts or vehicle_id are dropped.
+    """
+    cur.execute("ALTER TABLE vehicle_telemetry RENAME TO vehicle_telemetry_legacy")
+    for name in ("vehicle_telemetry_pkey", "vehicle_telemetry_vehicle_ts"):
+        cur.execute("ALTER INDEX IF EXISTS %s RENAME TO %s_legacy" % (name, name))
+    cur.execute(VEHICLE_TELEMETRY_SQL)
+    cur.execute("CREATE TABLE %s PARTITION OF vehicle_telemetry DEFAULT" % DEFAULT_PARTITION)
+
+    cur.execute("SELECT min(ts), max(ts) FROM vehicle_telemetry_legacy")
+    lo, hi = cur.fetchone()
+    now = time()
+    _create_partitions(cur, lo if lo is not None else now, now + days_ahead * 86400)
+
+    cols = ", ".join(VEHICLE_COLUMNS)
+    cur.execute("""
+        INSERT INTO vehicle_telemetry (%s)
+        SELECT %s FROM vehicle_telemetry_legacy
+        WHERE ts IS NOT NULL AND vehicle_id IS NOT NULL
+        ORDER BY id
+        ON CONFLICT (vehicle_id, ts) DO NOTHING
+    """ % (cols, cols))
+    print("vehicle_telemetry: migrated %d rows into daily partitions" % cur.rowcount)
+    cur.execute("DROP TABLE vehicle_telemetry_legacy")
+
+
+def maintain_partitions(conn, retention_days, days_ahead=7, now=None):
+    """
+    Create the daily partitions for the next `days_ahead` days and drop the
+    ones that ended more than `retention_days` ago (None keeps everything).
+    Returns (created, dropped).
+    """
+    now = time() if now is None else now
+    cur = conn.cursor()
+    created = _create_partitions(cur, now, now + days_ahead * 86400)
+
+    dropped = 0
+    if retention_days is not None:
+        cutoff = now - retention_days * 86400
+        cur.execute("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'vehicle_telemetry'::regclass
+        """)
+        for (name,) in cur.fetchall():
+            if not name.startswith(PARTITION_PREFIX):
+                continue
+            day = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").replace(tzinfo=timezone.utc)
+            if (day + timedelta(days=1)).timestamp() <= cutoff:
+                cur.execute("DROP TABLE %s" % name)
+                dropped += 1
+        cur.execute("DELETE FROM %s WHERE ts < %%s" % DEFAULT_PARTITION, (cutoff,))
+    conn.commit()
+    cur.close()
+    return created, dropped
+
+
+def prune_rows(conn, table, retention_seconds, now=None):
+    """Delete the rows of `table` with ts older than `retention_seconds`. Returns the count."""
+    now = time() if now is None else now
+    cur = conn.cursor()
+    cur.execute("DELETE FROM %s WHERE ts < %%s" % table, (now - retention_seconds,))
+    deleted = cur.rowcount
+    conn.commit()
+    cur.close()
+    return deleted
+
+
+def ensure_schema(conn, days_ahead=7):
+    """
+    Create the fleet tables if they do not exist yet, migrating an
+    unpartitioned vehicle_telemetry from older versions in place.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('vehicle_telemetry')")
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(VEHICLE_TELEMETRY_SQL)
+        cur.execute("CREATE TABLE %s PARTITION OF vehicle_telemetry DEFAULT" % DEFAULT_PARTITION)
+    elif row[0] != "p":
+        _migrate_legacy(cur, days_ahead)
+    now = time()
+    _create_partitions(cur, now, now + days_ahead * 86400)
+
+    cur.execute("SELECT to_regclass('vehicle_latest')")
+    if cur.fetchone()[0] is None:
+        cur.execute(VEHICLE_LATEST_SQL)
+        cur.execute(latest_upsert_sql("vehicle_telemetry"))
+
+    cur.execute(VEHICLE_EVENTS_SQL)
+    cur.execute(ROLLUP_DIRTY_SQL)
+    cur.execute("SELECT to_regclass(%s)", (ROLLUP_TABLES[0][0],))
+    backfill = cur.fetchone()[0] is None
+    for table, _ in ROLLUP_TABLES:
+        cur.execute(ROLLUP_SQL % table)
+    if backfill:
+        # Existing history is rolled up by the refresh loop
+        cur.execute(mark_dirty_sql("vehicle_telemetry"))
+    conn.commit()
+    cur.close()
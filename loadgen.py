@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Fleet-scale synthetic load for the central database.
+
+Uses seed_vehicle_telemetry.generate_row to fake any number of carts:
+
+  backfill  history of --days days at --rate rows/s per vehicle, loaded
+            through the same COPY ingest path as /api/ingest
+  live      keeps every vehicle reporting at --rate Hz, flushed in batches
+            every --flush seconds like the carts' replicators
+
+Both report the rows/s actually achieved, to size the central machine.
+Backfill through --url only lands in daily partitions that already exist
+(the rest goes to the default partition); the direct database target
+creates them first.
+
+  python3 loadgen.py backfill --vehicles 200 --days 30
+  python3 loadgen.py live --vehicles 200 --url http://localhost:8000 --token <INGEST_TOKEN>
+"""
+import argparse
+import random
+from time import monotonic, sleep, time
+
+import psycopg2
+
+from fleet_db import INGEST_COLUMNS, ingest_rows, refresh_rollups
+from fleet_schema import ensure_partitions, ensure_schema, rebuild_latest
+from seed_vehicle_telemetry import PG_CONFIG, ROWS_PER_VEHICLE, generate_row
+
+
+def vehicle_ids(count):
+    # The first six match the seeder, so they keep its per-vehicle behaviour
+    return ["IntelliCart-%02d" % (i + 1) for i in range(count)]
+
+
+def make_row(ts, vehicle_id):
+    """One generated row at exactly `ts`, in INGEST_COLUMNS order."""
+    row = generate_row(ts, vehicle_id, ROWS_PER_VEHICLE)
+    return tuple(row[c] for c in INGEST_COLUMNS)
+
+
+class DbTarget:
+    """Writes straight into PostgreSQL with fleet_db.ingest_rows."""
+
+    def __init__(self, pg_config):
+        self.conn = psycopg2.connect(**pg_config)
+        ensure_schema(self.conn)
+
+    def send(self, rows):
+        return ingest_rows(self.conn, rows)
+
+    def close(self):
+        self.conn.close()
+
+
+class HttpTarget:
+    """Posts to a running dashboard's /api/ingest, like a cart would."""
+
+    def __init__(self, url, token=None):
+        from replicator import HttpSink
+        self.sink = HttpSink(url, token=token)
+
+    def send(self, rows):
+        return self.sink.send(rows)
+
+    def close(self):
+        self.sink.close()
+
+
+def report(label, rows, inserted, elapsed):
+    print("%s: %d rows (%d new) in %.1f s -> %.0f rows/s"
+          % (label, rows, inserted, elapsed, rows / elapsed if elapsed > 0 else 0.0))
+
+
+def backfill(target, ids, days, rate, chunk):
+    """Generate `days` of history ending now, oldest first, `chunk` rows per batch."""
+    step = 1.0 / rate
+    end = time()
+    start = end - days * 86400
+    if isinstance(target, DbTarget):
+        ensure_partitions(target.conn, start, end)
+
+    total = inserted = 0
+    batch = []
+    t0 = last_report = monotonic()
+    ts = start
+    while ts < end:
+        for vid in ids:
+            batch.append(make_row(ts, vid))
+        if len(batch) >= chunk:
+            inserted += target.send(batch)
+            total += len(batch)
+            batch = []
+            if monotonic() - last_report >= 10:
+                report("backfill %.0f%%" % (100.0 * (ts - start) / (end - start)),
+                       total, inserted, monotonic() - t0)
+                last_report = monotonic()
+        ts += step
+    if batch:
+        inserted += target.send(batch)
+        total += len(batch)
+    report("backfill", total, inserted, monotonic() - t0)
+
+    if isinstance(target, DbTarget):
+        # Make the dashboard usable straight away instead of waiting for
+        # its refresh loop to catch up
+        t0 = monotonic()
+        rebuild_latest(target.conn)
+        minutes, hours = refresh_rollups(target.conn)
+        print("rollups: %d minutes, %d hours in %.1f s" % (minutes, hours, monotonic() - t0))
+
+
+def live(target, ids, rate, flush, duration):
+    """Report every vehicle at `rate` Hz until stopped (or for `duration` s)."""
+    step = 1.0 / rate
+    total = inserted = 0
+    batch = []
+    t0 = monotonic()
+    next_tick = next_flush = next_report = t0
+    print("live: %d vehicles at %.1f Hz (target %.0f rows/s), Ctrl+C to stop"
+          % (len(ids), rate, len(ids) * rate))
+    try:
+        while duration is None or monotonic() - t0 < duration:
+            now = time()
+            for vid in ids:
+                batch.append(make_row(now, vid))
+            next_tick += step
+
+            if monotonic() >= next_flush:
+                try:
+                    inserted += target.send(batch)
+                    total += len(batch)
+                    batch = []
+                except Exception as e:
+                    print("live: send failed, keeping %d rows for the next flush: %s" % (len(batch), e))
+                next_flush += flush
+            if monotonic() >= next_report + 10:
+                report("live", total, inserted, monotonic() - t0)
+                next_report = monotonic()
+
+            delay = next_tick - monotonic()
+            if delay > 0:
+                sleep(delay)
+            elif delay < -flush:
+                print("live: falling behind by %.1f s" % -delay)
+                next_tick = monotonic()
+    except KeyboardInterrupt:
+        pass
+    if batch:
+        inserted += target.send(batch)
+        total += len(batch)
+    report("live", total, inserted, monotonic() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic fleet telemetry load.")
+    parser.add_argument("mode", choices=("backfill", "live"))
+    parser.add_argument("--vehicles", type=int, default=6)
+    parser.add_argument("--rate", type=float, default=1.0, help="rows per second per vehicle")
+    parser.add_argument("--days", type=float, default=1.0, help="backfill depth")
+    parser.add_argument("--chunk", type=int, default=50000, help="rows per backfill COPY")
+    parser.add_argument("--flush", type=float, default=5.0, help="live batch interval (s)")
+    parser.add_argument("--duration", type=float, help="stop live mode after this many seconds")
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable runs")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--dsn", help="PostgreSQL DSN (default: seed_vehicle_telemetry.PG_CONFIG)")
+    target.add_argument("--url", help="post to a dashboard's /api/ingest instead")
+    parser.add_argument("--token", help="the dashboard's INGEST_TOKEN (with --url)")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.url:
+        sink = HttpTarget(args.url, args.token)
+    else:
+        sink = DbTarget({"dsn": args.dsn} if args.dsn else PG_CONFIG)
+
+    ids = vehicle_ids(args.vehicles)
+    try:
+        if args.mode == "backfill":
+            backfill(sink, ids, args.days, args.rate, args.chunk)
+        else:
+            live(sink, ids, args.rate, args.flush, args.duration)
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Store-and-forward replication of cart telemetry to the central database.
+
+The replicator tails the local `telemetry_all` view in ts order, attaches
+the cart's vehicle_id and ships batches to a sink (central PostgreSQL, or a
+SQLite file standing in for it). The ts of the last acknowledged row is
+persisted in telemetry.db, so after a Wi-Fi drop or a restart it resumes
+exactly where the central side stopped receiving.
+
+Run standalone:  python3 replicator.py --vehicle-id IntelliCart-01 --url http://<central-ip>:8000
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+from time import time
+
+from telemetry_events import EventDetector
+from telemetry_store import TELEMETRY_COLUMNS, connect, fetch_rows_after
+
+# Column order of vehicle_telemetry rows produced by the replicator
+VEHICLE_COLUMNS = ("ts", "vehicle_id") + TELEMETRY_COLUMNS[1:]
+
+# 0/1 columns that are BOOLEAN on the central side
+BOOL_COLUMNS = ("obstacle", "line_track", "avoid_obstacles",
+                "color_follow", "color_detect", "face_detect")
+
+STATE_SQL = """
+CREATE TABLE IF NOT EXISTS replication_state (
+  sink TEXT PRIMARY KEY,
+  ts REAL
+)
+"""
+
+
+# HTTP statuses meaning the batch itself is unacceptable (bad rows, too
+# large); anything else, including 401/403, is retried
+REJECT_STATUSES = (400, 413, 422)
+
+
+class BatchRejected(Exception):
+    """The sink refused a batch for its content; re-sending it cannot help."""
+
+
+def to_vehicle_row(vehicle_id, r):
+    """Local row (TELEMETRY_COLUMNS) → vehicle_telemetry row (VEHICLE_COLUMNS)."""
+    row = dict(zip(TELEMETRY_COLUMNS, r))
+    for name in BOOL_COLUMNS:
+        row[name] = bool(row[name])
+    row["vehicle_id"] = vehicle_id
+    return tuple(row[c] for c in VEHICLE_COLUMNS)
+
+
+class PostgresSink:
+    """
+    Writes batches straight into the central database through
+    fleet_db.ingest_rows, the same path as /api/ingest (duplicates skipped,
+    vehicle_latest, rollup queue and NOTIFY included). Events are extracted
+    here on the cart, as /api/ingest does for HttpSink.
+    """
+
+    name = "postgres"
+
+    def __init__(self, pg_config):
+        self.pg_config = pg_config
+        self._conn = None
+        self._events = EventDetector()
+
+    def send(self, rows):
+        import psycopg2
+        from fleet_db import ingest_rows
+
+        if self._conn is None:
+            self._conn = psycopg2.connect(**self.pg_config)
+        events, pending = self._events.detect(dict(zip(VEHICLE_COLUMNS, r)) for r in rows)
+        try:
+            inserted = ingest_rows(self._conn, rows, events)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # ingest_rows rolled back; the connection is still usable
+            raise BatchRejected(str(e).strip())
+        except Exception:
+            self.close()
+            raise
+        self._events.commit(pending)
+        return inserted
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class HttpSink:
+    """
+    Posts batches to the central dashboard's /api/ingest as gzip-compressed
+    NDJSON, so carts need no database credentials; `token` is the
+    dashboard's INGEST_TOKEN.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url, timeout=30.0, token=None):
+        self.url = base_url.rstrip("/") + "/api/ingest"
+        self.timeout = timeout
+        self.token = token
+
+    def send(self, rows):
+        lines = (json.dumps(dict(zip(VEHICLE_COLUMNS, r)), separators=(",", ":")) for r in rows)
+        body = gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=6)
+        headers = {
+            "Content-Type": "application/x-ndjson",
+            "Content-Encoding": "gzip",
+        }
+        if self.token:
+            headers["X-Ingest-Token"] = self.token
+        req = urllib.request.Request(self.url, data=body, method="POST", headers=headers)
+        # Non-2xx statuses raise HTTPError and are retried, unless the
+        # dashboard refused the batch itself
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                reply = json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            if e.code in REJECT_STATUSES:
+                raise BatchRejected("HTTP %d: %s" % (e.code, e.read(500).decode("utf-8", "replace")))
+            raise
+        return reply.get("inserted", len(rows))
+
+    def close(self):
+        pass
+
+
+class SqliteSink:
+    """Local stand-in for the central database (testing / bench setups)."""
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def send(self, rows):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS vehicle_telemetry (%s, UNIQUE (vehicle_id, ts))"
+                               % ", ".join(VEHICLE_COLUMNS))
+        before = self._conn.total_changes
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO vehicle_telemetry (%s) VALUES (%s)" % (
+                ", ".join(VEHICLE_COLUMNS), ", ".join("?" * len(VEHICLE_COLUMNS))), rows)
+        return self._conn.total_changes - before
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Replicator:
+    """
+    Background thread shipping local telemetry rows to `sink`.
+
+    Batches of up to `batch_size` rows newer than the high-water mark are
+    sent back to back while there is a backlog, then every `interval`
+    seconds. A failed send is retried with exponential backoff (capped at
+    `max_backoff`) from the same high-water mark; sinks skip rows they
+    already hold, which shows up as `duplicates` in stats(). A batch the
+    sink rejects as invalid (BatchRejected) is logged and skipped, counted
+    in `rejected`, so one bad row cannot stall replication.
+
+    With a `spool` (telemetry_spool.Spool), unsent rows older than
+    `spool_after` seconds (set just short of local raw retention) are
+    copied into the spool after a failed attempt and the high-water mark
+    moves past them, so an outage longer than local retention loses only
+    what the spool's byte cap evicts. Younger rows are not copied: they
+    are still in telemetry.db. The spool is drained first,
+    `drain_batch_size` rows per send, once the sink accepts data again.
+    """
+
+    def __init__(self, db_path, vehicle_id, sink, batch_size=500,
+                 interval=5.0, max_backoff=300.0, spool=None, drain_batch_size=5000,
+                 spool_after=6 * 86400):
+        self.db_path = db_path
+        self.vehicle_id = vehicle_id
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.spool = spool
+        self.drain_batch_size = drain_batch_size
+        self.spool_after = spool_after
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "sink": sink.name,
+            "high_water": None,
+            "rows_sent": 0,
+            "duplicates": 0,
+            "rows_drained": 0,
+            "rejected": 0,
+            "batches": 0,
+            "failures": 0,
+            "connected": False,
+            "last_error": None,
+            "last_success": None,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry-replicator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        if s["high_water"] is not None:
+            s["lag_seconds"] = max(0.0, time() - s["high_water"])
+        if self.spool is not None:
+            s["spool"] = self.spool.stats()
+        return s
+
+    def close(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _update(self, **kw):
+        with self._stats_lock:
+            self._stats.update(kw)
+
+    def load_high_water(self, conn):
+        conn.execute(STATE_SQL)
+        row = conn.execute("SELECT ts FROM replication_state WHERE sink = ?",
+                           (self.sink.name,)).fetchone()
+        return row[0] if row else 0.0
+
+    def save_high_water(self, conn, ts):
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO replication_state (sink, ts) VALUES (?, ?)",
+                         (self.sink.name, ts))
+
+    def fetch_batch(self, conn, high_water):
+        return fetch_rows_after(conn, high_water, self.batch_size)
+
+    def replicate_once(self, conn, high_water):
+        """
+        Send one batch. Returns (new high-water mark, rows sent, duplicates
+        the sink skipped); raises if the sink failed, leaving the high-water
+        mark untouched.
+        """
+        rows = self.fetch_batch(conn, high_water)
+        if not rows:
+            return high_water, 0, 0
+        inserted = self._send([to_vehicle_row(self.vehicle_id, r) for r in rows])
+        high_water = rows[-1][0]
+        self.save_high_water(conn, high_water)
+        return high_water, len(rows), len(rows) - inserted
+
+    def _send(self, rows):
+        """sink.send(), except that a rejected batch is logged and skipped."""
+        try:
+            return self.sink.send(rows)
+        except BatchRejected as e:
+            print("Replication: %s sink rejected %d rows, skipping them: %s"
+                  % (self.sink.name, len(rows), e))
+            with self._stats_lock:
+                self._stats["rejected"] += len(rows)
+            return len(rows)
+
+    def spool_pending(self, conn, high_water, cutoff):
+        """
+        Copy the unsent rows older than `cutoff` into the spool and return
+        the high-water mark past them.
+        """
+        while True:
+            rows = [r for r in self.fetch_batch(conn, high_water) if r[0] < cutoff]
+            if not rows:
+                return high_water
+            self.spool.append([to_vehicle_row(self.vehicle_id, r) for r in rows])
+            high_water = rows[-1][0]
+            self.save_high_water(conn, high_water)
+            if len(rows) < self.batch_size:
+                return high_water
+
+    def drain_spool(self):
+        """
+        Send spooled segments oldest first; a segment is deleted once all of
+        it was accepted. Returns (rows sent, duplicates); raises if the sink
+        failed, and the segment is re-sent whole next time.
+        """
+        sent = dups = 0
+        for name in self.spool.segments():
+            rows = self.spool.read(name)
+            for i in range(0, len(rows), self.drain_batch_size):
+                chunk = rows[i:i + self.drain_batch_size]
+                inserted = self._send(chunk)
+                sent += len(chunk)
+                dups += len(chunk) - inserted
+            self.spool.remove(name)
+            if self._stop.is_set():
+                break
+        return sent, dups
+
+    def _run(self):
+        conn = connect(self.db_path)
+        backoff = self.interval
+        try:
+            high_water = self.load_high_water(conn)
+            self._update(high_water=high_water)
+            while not self._stop.is_set():
+                try:
+                    if self.spool:
+                        drained, drained_dups = self.drain_spool()
+                        with self._stats_lock:
+                            self._stats["rows_drained"] += drained
+                            self._stats["duplicates"] += drained_dups
+                            if not self.spool:
+                                # Everything up to the local cursor is delivered
+                                self._stats["high_water"] = high_water
+                                self._stats["connected"] = True
+                                self._stats["last_success"] = time()
+                    high_water, sent, dups = self.replicate_once(conn, high_water)
+                except Exception as e:
+                    with self._stats_lock:
+                        if self._stats["connected"] or self._stats["failures"] == 0:
+                            print("Replication error (will retry):", e)
+                        self._stats["failures"] += 1
+                        self._stats["connected"] = False
+                        self._stats["last_error"] = str(e)
+                    if self.spool is not None:
+                        try:
+                            high_water = self.spool_pending(conn, high_water, time() - self.spool_after)
+                        except Exception as e:
+                            print("Telemetry spool error:", e)
+                    self._stop.wait(backoff)
+                    backoff = min(self.max_backoff, backoff * 2)
+                    continue
+
+                backoff = self.interval
+                if sent:
+                    with self._stats_lock:
+                        self._stats["rows_sent"] += sent
+                        self._stats["duplicates"] += dups
+                        self._stats["batches"] += 1
+                        self._stats["high_water"] = high_water
+                        self._stats["connected"] = True
+                        self._stats["last_success"] = time()
+                if sent < self.batch_size:
+                    self._stop.wait(self.interval)
+        finally:
+            self.sink.close()
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replicate cart telemetry to the central database.")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry.db"))
+    parser.add_argument("--vehicle-id", required=True)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--sqlite", metavar="PATH", help="SQLite stand-in for the central DB")
+    target.add_argument("--pg", metavar="DSN", help="PostgreSQL DSN, e.g. 'host=... dbname=postgres user=postgres'")
+    target.add_argument("--url", help="central dashboard base URL, e.g. http://<central-ip>:8000")
+    parser.add_argument("--token", help="the dashboard's INGEST_TOKEN (with --url)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        sink = SqliteSink(args.sqlite)
+    elif args.url:
+        sink = HttpSink(args.url, token=args.token)
+    else:
+        sink = PostgresSink({"dsn": args.pg})
+
+    # One pass over the backlog, then exit
+    rep = Replicator(args.db, args.vehicle_id, sink, batch_size=args.batch_size)
+    conn = connect(args.db)
+    try:
+        high_water = rep.load_high_water(conn)
+        total = duplicates = 0
+        while True:
+            high_water, sent, dups = rep.replicate_once(conn, high_water)
+            total += sent
+            duplicates += dups
+            if sent < rep.batch_size:
+                break
+        print("Replicated %d rows (%d already present) up to ts %.3f"
+              % (total, duplicates, high_water))
+    finally:
+        conn.close()
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
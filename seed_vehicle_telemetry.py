@@ -2,6 +2,8 @@ import time
 import random
 import psycopg2
 
+from fleet_schema import ensure_schema, mark_rollups_dirty, rebuild_latest
+
 
 PG_CONFIG = {
     "host": "localhost",
@@ -25,31 +27,7 @@ ROWS_PER_VEHICLE = 60   # history per vehicle (1 row/sec ≈ 1 minute)
 
 
 def ensure_table(conn):
-    cur = conn.cursor()
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS vehicle_telemetry (
-      id SERIAL PRIMARY KEY,
-      ts DOUBLE PRECISION,
-      vehicle_id TEXT,
-      speed DOUBLE PRECISION,
-      raw_speed DOUBLE PRECISION,
-      distance DOUBLE PRECISION,
-      line_l INTEGER,
-      line_m INTEGER,
-      line_r INTEGER,
-      motion TEXT,
-      line_state TEXT,
-      obstacle BOOLEAN,
-      cpu_temp DOUBLE PRECISION,
-      line_track BOOLEAN,
-      avoid_obstacles BOOLEAN,
-      color_follow BOOLEAN,
-      color_detect BOOLEAN,
-      face_detect BOOLEAN
-    )
-    """)
-    conn.commit()
-    cur.close()
+    ensure_schema(conn)
 
 
 def generate_row(now_ts, vehicle_id, idx):
@@ -155,6 +133,7 @@ def insert_rows(conn, rows):
           %(line_track)s, %(avoid_obstacles)s, %(color_follow)s,
           %(color_detect)s, %(face_detect)s
         )
+        ON CONFLICT (vehicle_id, ts) DO NOTHING
     """, rows)
     conn.commit()
     cur.close()
@@ -176,6 +155,8 @@ def main():
 
     print(f"Inserting {len(all_rows)} rows into vehicle_telemetry...")
     insert_rows(conn, all_rows)
+    rebuild_latest(conn)
+    mark_rollups_dirty(conn, since=now_ts - ROWS_PER_VEHICLE - 1)
     conn.close()
     print("Done. You can now run central_dashboard.py and see 6 vehicles.")
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Server-side sparklines for clients that cannot run Chart.js.
+
+render_svg() turns already-aggregated buckets (ts, avg, min, max) into a
+small self-contained SVG: the avg as a line over a shaded min..max band,
+broken where buckets are missing. Plain string formatting, no plotting
+libraries, so both the central dashboard and a cart can serve them.
+SparklineCache keeps the rendered images between requests.
+"""
+import threading
+from time import monotonic
+
+SPARKLINE_WIDTH = 160
+SPARKLINE_HEIGHT = 32
+
+# Cache keys are built from client parameters, so the cache is bounded
+SPARKLINE_CACHE_MAX = 2000
+
+# Line colour per metric (matches the dashboard's dark theme)
+METRIC_COLORS = {
+    "speed": "#2e63ff",
+    "distance": "#2ecc71",
+    "cpu_temp": "#ff3b63",
+}
+DEFAULT_COLOR = "#8ca0ff"
+
+
+def _fmt(v):
+    return ("%.1f" % v).rstrip("0").rstrip(".")
+
+
+def _runs(points, step):
+    """Split (ts, avg, min, max) points wherever more than one step is missing."""
+    runs, run, last = [], [], None
+    for p in points:
+        if p[1] is None:
+            continue
+        if run and p[0] - last > step * 1.5:
+            runs.append(run)
+            run = []
+        run.append(p)
+        last = p[0]
+    if run:
+        runs.append(run)
+    return runs
+
+
+def render_svg(points, start, end, step, width=SPARKLINE_WIDTH, height=SPARKLINE_HEIGHT,
+               color=DEFAULT_COLOR, title=None):
+    """
+    SVG sparkline of `points` ((ts, avg, min, max) buckets of `step`
+    seconds, oldest first) over [start, end]. min/max may be None to draw
+    the line only. An empty series renders an empty frame.
+    """
+    values = [v for p in points for v in p[1:] if v is not None]
+    lo, hi = (min(values), max(values)) if values else (0.0, 1.0)
+    if hi - lo < 1e-9:
+        lo, hi = lo - 1.0, hi + 1.0
+    span = float(end - start) or 1.0
+    pad = 1.5
+
+    def x(ts):
+        return _fmt(min(max((ts - start) / span, 0.0), 1.0) * width)
+
+    def y(v):
+        return _fmt(pad + (hi - v) / (hi - lo) * (height - 2 * pad))
+
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">'
+             % (width, height, width, height)]
+    if title:
+        parts.append("<title>%s</title>" % _escape(title))
+    for run in _runs(points, step):
+        if len(run) > 1 and all(p[2] is not None and p[3] is not None for p in run):
+            band = ["%s,%s" % (x(p[0]), y(p[3])) for p in run]
+            band += ["%s,%s" % (x(p[0]), y(p[2])) for p in reversed(run)]
+            parts.append('<polygon points="%s" fill="%s" fill-opacity="0.2"/>' % (" ".join(band), color))
+        if len(run) == 1:
+            parts.append('<circle cx="%s" cy="%s" r="1.5" fill="%s"/>' % (x(run[0][0]), y(run[0][1]), color))
+        else:
+            line = " ".join("%s,%s" % (x(p[0]), y(p[1])) for p in run)
+            parts.append('<polyline points="%s" fill="none" stroke="%s" stroke-width="1.5"'
+                         ' stroke-linejoin="round"/>' % (line, color))
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def _escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class SparklineCache:
+    """
+    Rendered sparklines by request key. An entry is reused until the data
+    behind it has a newer row (`newest`, e.g. the latest ts), and for at
+    least `min_age` seconds either way; past `max_entries` the oldest
+    entries are dropped.
+    """
+
+    def __init__(self, min_age, max_entries=SPARKLINE_CACHE_MAX):
+        self.min_age = min_age
+        self.max_entries = max_entries
+        self._entries = {}      # key -> (newest, rendered at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, newest, render, min_age=None):
+        """The cached value for `key`, or render()'s result, stored under it."""
+        entry = self._entries.get(key)
+        now = monotonic()
+        if entry is not None and (entry[0] == newest
+                                  or now - entry[1] < max(self.min_age, min_age or 0)):
+            return entry[2]
+        value = render()
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (newest, now, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+        return value
@@ -191,103 +191,126 @@ if(init3DCar()){
 }
 
 // Telemetry + HUD updates for controller (not charts)
-function tickController(){
-  fetch("/api/status").then(r=>r.json()).then(d=>{
-    const speed = d.speed || 0;
-    document.getElementById("speed-val").textContent = speed;
-
-    const needle = document.getElementById("needle");
-    const clamped = Math.max(0, Math.min(100, speed));
-    const angle = -90 + (clamped / 100) * 180;
-    needle.setAttribute("transform", "rotate(" + angle + " 100 100)");
-
-    document.getElementById("dist").textContent = d.distance;
-    document.getElementById("linestate").textContent = "["+d.line.join(", ")+"]";
-
-    let mode="Manual";
-    if(d.modes.line_track) mode="Line track";
-    if(d.modes.avoid_obstacles) mode="Avoid obstacles";
-    if(d.modes.color_follow) mode="Color follow";
-    document.getElementById("mode").textContent=mode;
-
-    toggleIds.forEach(k=>{
-      document.getElementById(k).checked = d.modes[k];
-    });
-
-    // sync sliders from backend if changed
-    if(typeof d.speed_limit !== "undefined"){
-      maxSlider.value = d.speed_limit;
-      maxLabel.textContent = d.speed_limit;
-    }
-    if(typeof d.safe_distance !== "undefined"){
-      safeSlider.value = d.safe_distance;
-      safeLabel.textContent = d.safe_distance;
-    }
-    if(typeof d.danger_distance !== "undefined"){
-      dangerSlider.value = d.danger_distance;
-      dangerLabel.textContent = d.danger_distance;
-    }
+function applyStatus(d){
+  const speed = d.speed || 0;
+  document.getElementById("speed-val").textContent = speed;
+
+  const needle = document.getElementById("needle");
+  const clamped = Math.max(0, Math.min(100, speed));
+  const angle = -90 + (clamped / 100) * 180;
+  needle.setAttribute("transform", "rotate(" + angle + " 100 100)");
+
+  document.getElementById("dist").textContent = d.distance;
+  document.getElementById("linestate").textContent = "["+d.line.join(", ")+"]";
+
+  let mode="Manual";
+  if(d.modes.line_track) mode="Line track";
+  if(d.modes.avoid_obstacles) mode="Avoid obstacles";
+  if(d.modes.color_follow) mode="Color follow";
+  document.getElementById("mode").textContent=mode;
+
+  toggleIds.forEach(k=>{
+    document.getElementById(k).checked = d.modes[k];
+  });
 
-    // Car motion HUD
-    const motion = d.motion || "stop";
-    const motionText = document.getElementById("motion-text");
-    motionText.textContent = motion.charAt(0).toUpperCase() + motion.slice(1);
-
-    if(use3DCar && carMesh){
-      if(motion === "left"){
-        carMesh.rotation.y = 0.5;
-      } else if(motion === "right"){
-        carMesh.rotation.y = -0.5;
-      } else {
-        carMesh.rotation.y = 0.0;
-      }
-      carMesh.position.y = 0.1 * Math.sin(Date.now()/200) * (clamped/100);
-    } else {
-      const canvas = document.getElementById("car3d-canvas");
-      let rot = 0;
-      if(motion === "left") rot = -10;
-      else if(motion === "right") rot = 10;
-      canvas.style.transform = "perspective(300px) rotateY("+rot+"deg)";
-    }
+  // sync sliders from backend if changed
+  if(typeof d.speed_limit !== "undefined"){
+    maxSlider.value = d.speed_limit;
+    maxLabel.textContent = d.speed_limit;
+  }
+  if(typeof d.safe_distance !== "undefined"){
+    safeSlider.value = d.safe_distance;
+    safeLabel.textContent = d.safe_distance;
+  }
+  if(typeof d.danger_distance !== "undefined"){
+    dangerSlider.value = d.danger_distance;
+    dangerLabel.textContent = d.danger_distance;
+  }
 
-    // Radar HUD using thresholds
-    const radar = document.getElementById("radar");
-    const radarLabel = document.getElementById("radar-label");
-    const dist = d.distance || 0;
-    const safeDist = d.safe_distance || 40;
-    const dangerDist = d.danger_distance || 20;
-
-    radar.classList.remove("radar-safe","radar-close","radar-danger");
-    if(dist <= 0 || dist > safeDist){
-      radar.classList.add("radar-safe");
-      radarLabel.textContent = "Safe";
-    } else if(dist > dangerDist){
-      radar.classList.add("radar-close");
-      radarLabel.textContent = "Obstacle";
+  // Car motion HUD
+  const motion = d.motion || "stop";
+  const motionText = document.getElementById("motion-text");
+  motionText.textContent = motion.charAt(0).toUpperCase() + motion.slice(1);
+
+  if(use3DCar && carMesh){
+    if(motion === "left"){
+      carMesh.rotation.y = 0.5;
+    } else if(motion === "right"){
+      carMesh.rotation.y = -0.5;
     } else {
-      radar.classList.add("radar-danger");
-      radarLabel.textContent = "Too close";
+      carMesh.rotation.y = 0.0;
     }
+    carMesh.position.y = 0.1 * Math.sin(Date.now()/200) * (clamped/100);
+  } else {
+    const canvas = document.getElementById("car3d-canvas");
+    let rot = 0;
+    if(motion === "left") rot = -10;
+    else if(motion === "right") rot = 10;
+    canvas.style.transform = "perspective(300px) rotateY("+rot+"deg)";
+  }
 
-    // Line HUD
-    const lineDot = document.getElementById("line-car-dot");
-    const lineStatusText = document.getElementById("line-status");
-    const lineState = d.line_state || "stop";
-
-    let label = "No line";
-    let offset = 50;
-    if(lineState === "forward"){
-      label = "Center";
-      offset = 50;
-    } else if(lineState === "left"){
-      label = "Left";
-      offset = 35;
-    } else if(lineState === "right"){
-      label = "Right";
-      offset = 65;
-    }
-    lineStatusText.textContent = label;
-    lineDot.style.left = offset + "%";
-  }).catch(()=>{});
+  // Radar HUD using thresholds
+  const radar = document.getElementById("radar");
+  const radarLabel = document.getElementById("radar-label");
+  const dist = d.distance || 0;
+  const safeDist = d.safe_distance || 40;
+  const dangerDist = d.danger_distance || 20;
+
+  radar.classList.remove("radar-safe","radar-close","radar-danger");
+  if(dist <= 0 || dist > safeDist){
+    radar.classList.add("radar-safe");
+    radarLabel.textContent = "Safe";
+  } else if(dist > dangerDist){
+    radar.classList.add("radar-close");
+    radarLabel.textContent = "Obstacle";
+  } else {
+    radar.classList.add("radar-danger");
+    radarLabel.textContent = "Too close";
+  }
+
+  // Line HUD
+  const lineDot = document.getElementById("line-car-dot");
+  const lineStatusText = document.getElementById("line-status");
+  const lineState = d.line_state || "stop";
+
+  let label = "No line";
+  let offset = 50;
+  if(lineState === "forward"){
+    label = "Center";
+    offset = 50;
+  } else if(lineState === "left"){
+    label = "Left";
+    offset = 35;
+  } else if(lineState === "right"){
+    label = "Right";
+    offset = 65;
+  }
+  lineStatusText.textContent = label;
+  lineDot.style.left = offset + "%";
+
+  // telemetry.js takes its live chart points from here
+  document.dispatchEvent(new CustomEvent("status", { detail: d }));
+}
+
+function tickController(){
+  fetch("/api/status").then(r=>r.json()).then(applyStatus).catch(()=>{});
+}
+
+// Live status is pushed by the server (only when it changes); fall back to
+// polling when Server-Sent Events are unavailable or the stream is closed.
+let statusPoll = null;
+function startStatusPolling(){
+  if(statusPoll === null) statusPoll = setInterval(tickController,200);
+}
+
+if(window.EventSource){
+  const statusStream = new EventSource("/api/status/stream?rate=5");
+  statusStream.onmessage = e => {
+    try { applyStatus(JSON.parse(e.data)); } catch(err) {}
+  };
+  statusStream.onerror = () => {
+    if(statusStream.readyState === EventSource.CLOSED) startStatusPolling();
+  };
+} else {
+  startStatusPolling();
 }
-setInterval(tickController,200);
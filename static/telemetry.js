@@ -131,132 +131,95 @@ const modesChart   = createMultiLineChart(
   -0.1, 1.1
 );
 
-let t = 0;
+const historySeconds = 600;
+let historyLoaded = false;  // live samples wait until the backfill is drawn
 
-// Push new point, trim history
-function pushPoint(chart, value) {
+// Append one columnar history chunk (labels are bucket timestamps). The
+// first returned bucket may repeat our newest one with more samples in it,
+// so any points at or after the chunk start are replaced.
+function appendSeries(chart, ts, series) {
   const labels = chart.data.labels;
-  const data = chart.data.datasets[0].data;
-  labels.push(t);
-  data.push(value);
-  if (labels.length > maxPoints) {
-    labels.shift();
-    data.shift();
+  if (ts.length) {
+    let keep = labels.length;
+    while (keep > 0 && labels[keep - 1] >= ts[0]) keep--;
+    labels.splice(keep);
+    chart.data.datasets.forEach(ds => ds.data.splice(keep));
   }
-}
 
-// For multi-line chart
-function pushPointMulti(chart, values) {
-  const labels = chart.data.labels;
-  labels.push(t);
-  if (labels.length > maxPoints) {
-    labels.shift();
+  labels.push(...ts);
+  chart.data.datasets.forEach((ds, i) => ds.data.push(...(series[i] || [])));
+
+  const drop = labels.length - maxPoints;
+  if (drop > 0) {
+    labels.splice(0, drop);
+    chart.data.datasets.forEach(ds => ds.data.splice(0, drop));
   }
-  chart.data.datasets.forEach((ds, i) => {
-    ds.data.push(values[i]);
-    if (ds.data.length > maxPoints) {
-      ds.data.shift();
-    }
-  });
 }
 
-// Load history from DB (e.g. last 10 minutes)
-function loadHistory(seconds = 600) {
-  fetch(`/api/history?seconds=${seconds}`)
+function applyHistory(c) {
+  const num = arr => (arr || []).map(v => Number(v) || 0);
+  const ts = c.ts || [];
+
+  appendSeries(speedChart, ts, [num(c.speed)]);
+  appendSeries(motorChart, ts, [num(c.raw_speed)]);
+  appendSeries(cpuChart, ts, [num(c.cpu_temp)]);
+  appendSeries(distanceChart, ts, [num(c.distance)]);
+  appendSeries(lineChart, ts, [num(c.line_l), num(c.line_m), num(c.line_r)]);
+  appendSeries(modesChart, ts, [
+    num(c.line_track), num(c.avoid_obstacles), num(c.color_follow), num(c.obstacle),
+  ]);
+
+  speedChart.update();
+  motorChart.update();
+  cpuChart.update();
+  distanceChart.update();
+  lineChart.update();
+  modesChart.update();
+}
+
+// Load history from DB (e.g. last 10 minutes), aggregated server-side
+// into at most maxPoints buckets and returned one array per field.
+// Obstacle/mode values are duty cycles 0..1.
+function loadHistory(seconds = historySeconds) {
+  fetch(`/api/history?seconds=${seconds}&max_points=${maxPoints}&format=columns`)
     .then(r => r.json())
     .then(data => {
-      const history = data.history || [];
-
-      // clear existing data
       [speedChart, motorChart, cpuChart, distanceChart, lineChart, modesChart].forEach(ch => {
         ch.data.labels = [];
         ch.data.datasets.forEach(ds => ds.data = []);
       });
-      t = 0;
-
-      history.forEach(sample => {
-        const sp   = sample.speed || 0;
-        const raw  = sample.raw_speed || 0;
-        const dist = sample.distance || 0;
-        const cpu  = sample.cpu_temp || 0;
-        const line = sample.line || [0,0,0];
-        const modes = sample.modes || {};
-        const obstacle = sample.obstacle ? 1 : 0;
-
-        const l = line[0] || 0;
-        const m = line[1] || 0;
-        const r = line[2] || 0;
-
-        const ml = modes.line_track ? 1 : 0;
-        const ma = modes.avoid_obstacles ? 1 : 0;
-        const mf = modes.color_follow ? 1 : 0;
-
-        t += 1;
-        pushPoint(speedChart, sp);
-        pushPoint(motorChart, raw);
-        pushPoint(cpuChart, cpu);
-        pushPoint(distanceChart, dist);
-        pushPointMulti(lineChart, [l, m, r]);
-        pushPointMulti(modesChart, [ml, ma, mf, obstacle]);
-      });
-
-      speedChart.update();
-      motorChart.update();
-      cpuChart.update();
-      distanceChart.update();
-      lineChart.update();
-      modesChart.update();
+      applyHistory(data.columns || {});
     })
     .catch(() => {
       // ignore
-    });
+    })
+    .finally(() => { historyLoaded = true; });
 }
 
-// Poll backend for live data (append on top of history)
-function updateTelemetryCharts() {
-  fetch("/api/status")
-    .then(r => r.json())
-    .then(d => {
-      t += 1;
-
-      const speed = d.speed || 0;
-      const rawSpeed = d.raw_speed || 0;
-      const dist = d.distance || 0;
-      const cpu = d.cpu_temp || 0;
-      const line = d.line || [0,0,0];
-      const modes = d.modes || {};
-      const obstacle = d.obstacle_detected ? 1 : 0;
-
-      // Single-line charts
-      pushPoint(speedChart, speed);
-      pushPoint(motorChart, rawSpeed);
-      pushPoint(cpuChart, cpu);
-      pushPoint(distanceChart, dist);
-
-      // Line sensors: 0/1
-      const l = line[0] || 0;
-      const m = line[1] || 0;
-      const r = line[2] || 0;
-      pushPointMulti(lineChart, [l, m, r]);
-
-      // Modes: bool → 0/1
-      const ml = modes.line_track ? 1 : 0;
-      const ma = modes.avoid_obstacles ? 1 : 0;
-      const mf = modes.color_follow ? 1 : 0;
-      pushPointMulti(modesChart, [ml, ma, mf, obstacle]);
-
-      speedChart.update();
-      motorChart.update();
-      cpuChart.update();
-      distanceChart.update();
-      lineChart.update();
-      modesChart.update();
-    })
-    .catch(() => {
-      // ignore errors
-    });
+// Live tail from the status stream controller.js already holds open (the
+// DB only sees rows once the writer commits its batch, seconds later). One
+// point per second of server ts, as logged, so it lines up with the history
+// buckets.
+let lastLiveSecond = 0;
+function appendStatus(d) {
+  if (!historyLoaded || !d.ts || Math.floor(d.ts) <= lastLiveSecond) return;
+  lastLiveSecond = Math.floor(d.ts);
+  const line = d.line || [0, 0, 0];
+  const modes = d.modes || {};
+  applyHistory({
+    ts: [d.ts],
+    speed: [d.speed],
+    raw_speed: [d.raw_speed],
+    cpu_temp: [d.cpu_temp],
+    distance: [d.distance],
+    line_l: [line[0]], line_m: [line[1]], line_r: [line[2]],
+    line_track: [modes.line_track ? 1 : 0],
+    avoid_obstacles: [modes.avoid_obstacles ? 1 : 0],
+    color_follow: [modes.color_follow ? 1 : 0],
+    obstacle: [d.obstacle_detected ? 1 : 0],
+  });
 }
 
-// First load DB history, then start live polling
-loadHistory(600);
-setInterval(updateTelemetryCharts, 1000);  // 1 Hz live updates
+// First load DB history, then append live samples on top
+loadHistory(historySeconds);
+document.addEventListener("status", e => appendStatus(e.detail));
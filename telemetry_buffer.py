@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Full-rate in-memory telemetry capture for the cart.
+
+SQLite only receives one row per second; this ring buffer keeps every
+control-loop sample (20 Hz) for the last few minutes in fixed-size typed
+arrays, so near-misses can be inspected or dumped to disk afterwards.
+"""
+import csv
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from telemetry_store import FLAG_BITS, LINE_STATES, MOTIONS, encode_flags, enum_code
+
+
+# (column, array typecode). Motion/line state are stored as enum codes and
+# the obstacle + mode flags as one bitmask; both are decoded on read.
+RING_COLUMNS = (
+    ("ts", "d"),
+    ("speed", "h"),
+    ("raw_speed", "h"),
+    ("distance", "h"),
+    ("line_l", "H"),
+    ("line_m", "H"),
+    ("line_r", "H"),
+    ("motion", "B"),
+    ("line_state", "B"),
+    ("flags", "B"),
+    ("cpu_temp", "f"),
+)
+
+# Decoded output columns, in the order they are returned / dumped
+OUTPUT_COLUMNS = (
+    "ts", "speed", "raw_speed", "distance", "line_l", "line_m", "line_r",
+    "motion", "line_state", "cpu_temp",
+) + FLAG_BITS
+
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, int(value)))
+
+
+class TelemetryRing:
+    """
+    Fixed-capacity ring of telemetry samples stored column-wise.
+
+    `append()` is called from the control loop and only does a handful of
+    array writes under a short lock; readers copy the columns out.
+    """
+
+    def __init__(self, seconds=300, rate_hz=20):
+        self.rate_hz = rate_hz
+        self.capacity = int(seconds * rate_hz)
+        self._cols = {name: array(code, [0] * self.capacity) for name, code in RING_COLUMNS}
+        self._head = 0      # next slot to write
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        """Store one sample (same dict the SQLite logger receives)."""
+        values = (
+            ("ts", row["ts"]),
+            ("speed", _clamp(row["speed"], -32768, 32767)),
+            ("raw_speed", _clamp(row["raw_speed"], -32768, 32767)),
+            ("distance", _clamp(row["distance"], -32768, 32767)),
+            ("line_l", _clamp(row["line_l"], 0, 65535)),
+            ("line_m", _clamp(row["line_m"], 0, 65535)),
+            ("line_r", _clamp(row["line_r"], 0, 65535)),
+            ("motion", enum_code(MOTIONS, row["motion"])),
+            ("line_state", enum_code(LINE_STATES, row["line_state"])),
+            ("flags", encode_flags(row)),
+            ("cpu_temp", row["cpu_temp"]),
+        )
+        with self._lock:
+            i = self._head
+            for name, value in values:
+                self._cols[name][i] = value
+            self._head = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _ordered(self):
+        """Copy of every raw column in chronological order."""
+        with self._lock:
+            start = (self._head - self._count) % self.capacity
+            end = start + self._count
+            out = {}
+            for name, col in self._cols.items():
+                if end <= self.capacity:
+                    out[name] = col[start:end]
+                else:
+                    out[name] = col[start:] + col[:end - self.capacity]
+        return out
+
+    def columns(self, since=None):
+        """
+        Decoded samples as one list per column (see OUTPUT_COLUMNS),
+        optionally limited to samples with ts >= since.
+        """
+        raw = self._ordered()
+        first = bisect_left(raw["ts"], since) if since is not None else 0
+
+        out = {}
+        for name in ("ts", "speed", "raw_speed", "distance",
+                     "line_l", "line_m", "line_r"):
+            out[name] = raw[name][first:].tolist()
+        # float32 storage; round away the single-precision noise
+        out["cpu_temp"] = [round(v, 2) for v in raw["cpu_temp"][first:]]
+        out["motion"] = [MOTIONS[c] for c in raw["motion"][first:]]
+        out["line_state"] = [LINE_STATES[c] for c in raw["line_state"][first:]]
+        flags = raw["flags"][first:]
+        for bit, name in enumerate(FLAG_BITS):
+            out[name] = [(f >> bit) & 1 for f in flags]
+        return out
+
+    def dump(self, path, since=None):
+        """Write the buffered samples to a CSV file. Returns the row count."""
+        cols = self.columns(since)
+        with open(path, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(OUTPUT_COLUMNS)
+            w.writerows(zip(*(cols[name] for name in OUTPUT_COLUMNS)))
+        return len(cols["ts"])
+
+
+def dump_to_dir(ring, directory, reason="manual", keep=50):
+    """
+    Dump the whole ring into `directory` as highres-<time>-<reason>.csv and
+    delete the oldest dumps beyond `keep`. Returns (filename, rows).
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = "highres-%s-%s.csv" % (datetime.now().strftime("%Y%m%d-%H%M%S"), reason)
+    rows = ring.dump(os.path.join(directory, name))
+
+    dumps = sorted(f for f in os.listdir(directory) if f.startswith("highres-"))
+    for old in dumps[:-keep]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except OSError:
+            pass
+    return name, rows
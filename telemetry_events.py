@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Turns telemetry rows into compact event records.
+
+EventDetector keeps a little state per vehicle and emits an event on every
+transition instead of repeating a flag each second:
+
+  obstacle_enter / obstacle_exit    value = distance (cm)
+  mode_on / mode_off                detail = mode name
+  line_lost / line_found            only while line tracking is on
+  cpu_hot / cpu_cool                with hysteresis between CPU_HOT_C and
+                                    CPU_COOL_C, value = cpu_temp
+
+Pure Python so it runs both at central ingest and on a cart. Rows are
+dicts with the vehicle_telemetry column names.
+"""
+
+MODE_NAMES = ("line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect")
+
+# Over-temperature enters at CPU_HOT_C and only clears below CPU_COOL_C,
+# so a cart hovering around the limit does not flap
+CPU_HOT_C = 80.0
+CPU_COOL_C = 75.0
+
+# Order of event tuples returned by the detector
+EVENT_COLUMNS = ("vehicle_id", "ts", "kind", "detail", "value")
+
+
+class _VehicleState:
+    __slots__ = ("ts", "obstacle", "modes", "line_lost", "hot")
+
+    def __init__(self, row):
+        self.ts = row["ts"]
+        self.obstacle = bool(row.get("obstacle"))
+        self.modes = {m: bool(row.get(m)) for m in MODE_NAMES}
+        self.line_lost = _line_lost(row)
+        temp = row.get("cpu_temp")
+        self.hot = temp is not None and temp >= CPU_HOT_C
+
+    def copy(self):
+        new = _VehicleState.__new__(_VehicleState)
+        new.ts, new.obstacle, new.line_lost, new.hot = self.ts, self.obstacle, self.line_lost, self.hot
+        new.modes = dict(self.modes)
+        return new
+
+
+def _line_lost(row):
+    return bool(row.get("line_track")) and row.get("line_state") == "stop"
+
+
+class EventDetector:
+    """
+    Incremental per-vehicle transition detector.
+
+    The first row seen for a vehicle only sets its state. A batch older than
+    the vehicle's last row (e.g. a spool drained after an outage) is run
+    against its own state, seeded from its first row, so it cannot corrupt
+    the live stream's edges.
+
+    When the events are stored with the rows, use detect() and commit()
+    the returned state only after the write succeeded: a batch that failed
+    and is re-sent is then detected again from the same state.
+    """
+
+    def __init__(self):
+        self._state = {}
+
+    def detect(self, rows):
+        """
+        Events for `rows` (any vehicles, each in ts order) without changing
+        the detector. Returns (events, pending state for commit()).
+        """
+        events = []
+        live = {}
+        late = {}
+        for row in rows:
+            vid = row["vehicle_id"]
+            state = live.get(vid)
+            if state is None:
+                current = self._state.get(vid)
+                if current is None:
+                    live[vid] = _VehicleState(row)
+                    continue
+                state = live[vid] = current.copy()
+            if row["ts"] <= state.ts or vid in late:
+                state = late.get(vid)
+                if state is None:
+                    late[vid] = _VehicleState(row)
+                    continue
+            self._transitions(state, row, events)
+        return events, live
+
+    def commit(self, pending):
+        """Adopt the state from detect() once its batch is stored."""
+        for vid, state in pending.items():
+            current = self._state.get(vid)
+            # Concurrent batches: only ever move a vehicle's state forward
+            if current is None or state.ts > current.ts:
+                self._state[vid] = state
+
+    def feed(self, rows):
+        """detect() and commit() in one go. Returns event tuples."""
+        events, pending = self.detect(rows)
+        self.commit(pending)
+        return events
+
+    def _transitions(self, state, row, events):
+        vid, ts = row["vehicle_id"], row["ts"]
+
+        obstacle = bool(row.get("obstacle"))
+        if obstacle != state.obstacle:
+            events.append((vid, ts, "obstacle_enter" if obstacle else "obstacle_exit", "",
+                           row.get("distance")))
+            state.obstacle = obstacle
+
+        for mode in MODE_NAMES:
+            on = bool(row.get(mode))
+            if on != state.modes[mode]:
+                events.append((vid, ts, "mode_on" if on else "mode_off", mode, None))
+                state.modes[mode] = on
+
+        lost = _line_lost(row)
+        if lost != state.line_lost:
+            # Switching line tracking off is a mode_off, not a found line
+            if lost or row.get("line_track"):
+                events.append((vid, ts, "line_lost" if lost else "line_found", "", None))
+            state.line_lost = lost
+
+        temp = row.get("cpu_temp")
+        if temp is not None:
+            if not state.hot and temp >= CPU_HOT_C:
+                events.append((vid, ts, "cpu_hot", "", temp))
+                state.hot = True
+            elif state.hot and temp < CPU_COOL_C:
+                events.append((vid, ts, "cpu_cool", "", temp))
+                state.hot = False
+
+        state.ts = ts
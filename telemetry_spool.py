@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Disk-backed spool for telemetry the central side could not receive.
+
+While the central store is unreachable, unsent rows simply wait in
+telemetry.db. Only those that local retention is about to prune are copied
+into gzip-compressed NDJSON segment files next to it
+(spool/spool-<seq>.ndjson.gz), and the replicator's high-water mark moves
+past them, so the table can be pruned as usual. The spool stays within a
+byte cap by evicting its oldest segments. On reconnect the segments are
+sent back oldest first, then the rest of the table.
+
+Only the replicator thread touches the spool; the control loop never
+waits on it.
+"""
+import gzip
+import json
+import os
+import threading
+
+SEGMENT_PREFIX = "spool-"
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+
+class Spool:
+    """
+    Append-only segment files capped at `max_bytes` in total.
+
+    Every `append()` adds one gzip member (one JSON array per row) to the
+    newest segment, starting a new one once it passes `segment_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, segment_bytes=1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        segs = self.segments()
+        self._seq = self._seq_of(segs[-1]) if segs else 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "rows_spooled": 0,
+            "segments_evicted": 0,
+            "bytes_evicted": 0,
+        }
+
+    @staticmethod
+    def _seq_of(name):
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def segments(self):
+        """Segment file names, oldest first."""
+        return sorted(f for f in os.listdir(self.directory)
+                      if f.startswith(SEGMENT_PREFIX) and f.endswith(SEGMENT_SUFFIX))
+
+    def size(self):
+        total = 0
+        for name in self.segments():
+            try:
+                total += os.path.getsize(self._path(name))
+            except OSError:
+                pass
+        return total
+
+    def __bool__(self):
+        return bool(self.segments())
+
+    def append(self, rows):
+        """Spool a batch of row tuples, then evict down to the byte cap."""
+        if not rows:
+            return
+        segs = self.segments()
+        if not segs or os.path.getsize(self._path(segs[-1])) >= self.segment_bytes:
+            self._seq += 1
+            name = "%s%010d%s" % (SEGMENT_PREFIX, self._seq, SEGMENT_SUFFIX)
+        else:
+            name = segs[-1]
+
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in rows)
+        with open(self._path(name), "ab") as f:
+            f.write(gzip.compress(data.encode(), compresslevel=6))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._lock:
+            self._stats["rows_spooled"] += len(rows)
+        self._evict()
+
+    def _evict(self):
+        segs = self.segments()
+        sizes = [os.path.getsize(self._path(n)) for n in segs]
+        total = sum(sizes)
+        # The newest segment always survives, even if it alone is over the cap
+        for name, size in zip(segs[:-1], sizes):
+            if total <= self.max_bytes:
+                break
+            self.remove(name)
+            total -= size
+            with self._lock:
+                if self._stats["segments_evicted"] == 0:
+                    print("Telemetry spool over %d bytes, dropping oldest segments" % self.max_bytes)
+                self._stats["segments_evicted"] += 1
+                self._stats["bytes_evicted"] += size
+
+    def read(self, name):
+        """All rows of one segment, as lists. A torn last line is skipped."""
+        rows = []
+        try:
+            with gzip.open(self._path(name), "rt") as f:
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        pass
+        except (EOFError, OSError):
+            # Truncated by a power cut mid-write: keep what was readable
+            pass
+        return rows
+
+    def remove(self, name):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        segs = self.segments()
+        s["segments"] = len(segs)
+        s["bytes"] = self.size()
+        return s
@@ -0,0 +1,711 @@
+#!/usr/bin/env python3
+"""
+Cart-side telemetry storage (SQLite).
+
+The control loop must never wait on the SD card, so rows are handed to a
+background writer thread through a bounded queue and committed in batches.
+The database runs in WAL mode so Flask request threads can read through
+their own read-only connections while the writer commits.
+
+New rows are stored compactly in `telemetry_packed`; the original wide
+`telemetry` table is kept (older databases and STORAGE_MODE "wide") and the
+`telemetry_all` view decodes both into the same columns for every reader.
+"""
+import math
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import sleep, time
+
+
+# Column order of the `telemetry` table (also the order rows are inserted in)
+TELEMETRY_COLUMNS = (
+    "ts", "speed", "raw_speed", "distance",
+    "line_l", "line_m", "line_r",
+    "motion", "line_state", "obstacle", "cpu_temp",
+    "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+# Enumerations used wherever a sample is stored as small integers
+# (ring buffer, compact rows). Append only: the index is the stored code.
+MOTIONS = ("stop", "forward", "backward", "left", "right")
+LINE_STATES = ("stop", "forward", "left", "right")
+
+# Bit positions of the 0/1 flags when packed into one integer
+FLAG_BITS = ("obstacle", "line_track", "avoid_obstacles",
+             "color_follow", "color_detect", "face_detect")
+
+
+def encode_flags(row):
+    flags = 0
+    for bit, name in enumerate(FLAG_BITS):
+        if row[name]:
+            flags |= 1 << bit
+    return flags
+
+
+def enum_code(values, value):
+    """Code of `value` in an enumeration tuple (0 / first entry if unknown)."""
+    try:
+        return values.index(value)
+    except ValueError:
+        return 0
+
+
+INSERT_SQL = "INSERT INTO telemetry (%s) VALUES (%s)" % (
+    ", ".join(TELEMETRY_COLUMNS),
+    ", ".join(":" + c for c in TELEMETRY_COLUMNS),
+)
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS telemetry (
+  ts REAL,
+  speed REAL,
+  raw_speed REAL,
+  distance REAL,
+  line_l INTEGER,
+  line_m INTEGER,
+  line_r INTEGER,
+  motion TEXT,
+  line_state TEXT,
+  obstacle INTEGER,
+  cpu_temp REAL,
+  line_track INTEGER,
+  avoid_obstacles INTEGER,
+  color_follow INTEGER,
+  color_detect INTEGER,
+  face_detect INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_telemetry_ts ON telemetry (ts);
+"""
+
+# Compact storage: one clustered row per sample, keyed on ts (no separate
+# index to update), with the text and 0/1 columns packed into small ints.
+PACKED_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS telemetry_packed (
+  ts REAL PRIMARY KEY,
+  speed INTEGER,
+  raw_speed INTEGER,
+  distance INTEGER,
+  line INTEGER,         -- line_l | line_m << 16 | line_r << 32
+  motion INTEGER,       -- index into MOTIONS
+  line_state INTEGER,   -- index into LINE_STATES
+  flags INTEGER,        -- FLAG_BITS bitmask
+  cpu_temp INTEGER      -- millidegrees C, as read from sysfs
+) WITHOUT ROWID;
+"""
+
+PACKED_INSERT_SQL = """
+INSERT OR IGNORE INTO telemetry_packed
+  (ts, speed, raw_speed, distance, line, motion, line_state, flags, cpu_temp)
+VALUES (?,?,?,?,?,?,?,?,?)
+"""
+
+
+def _case(column, values):
+    return "CASE %s %s END" % (column, " ".join(
+        "WHEN %d THEN '%s'" % (i, v) for i, v in enumerate(values)))
+
+
+# Every read goes through this view: wide rows plus decoded compact rows, in
+# TELEMETRY_COLUMNS shape. SQLite pushes ts ranges down into both tables.
+RAW_SOURCE = "telemetry_all"
+
+# One SELECT per storage table, each yielding TELEMETRY_COLUMNS
+RAW_SELECTS = (
+    "SELECT %s FROM telemetry" % ", ".join(TELEMETRY_COLUMNS),
+    """SELECT ts, speed, raw_speed, distance,
+       line & 65535 AS line_l, (line >> 16) & 65535 AS line_m, (line >> 32) & 65535 AS line_r,
+       %s AS motion, %s AS line_state,
+       flags & 1 AS obstacle, cpu_temp / 1000.0 AS cpu_temp,
+       %s
+FROM telemetry_packed""" % (
+        _case("motion", MOTIONS),
+        _case("line_state", LINE_STATES),
+        ", ".join("(flags >> %d) & 1 AS %s" % (bit, name)
+                  for bit, name in enumerate(FLAG_BITS) if bit > 0),
+    ),
+)
+
+VIEW_SQL = """
+DROP VIEW IF EXISTS telemetry_all;
+CREATE VIEW telemetry_all AS
+%s;
+""" % "\nUNION ALL\n".join(RAW_SELECTS)
+
+
+def encode_row(row):
+    """Row dict → PACKED_INSERT_SQL parameters."""
+    line = (_clamp16(row["line_l"]) | _clamp16(row["line_m"]) << 16
+            | _clamp16(row["line_r"]) << 32)
+    return (
+        row["ts"], int(row["speed"]), int(row["raw_speed"]), int(row["distance"]),
+        line,
+        enum_code(MOTIONS, row["motion"]),
+        enum_code(LINE_STATES, row["line_state"]),
+        encode_flags(row),
+        int(round(row["cpu_temp"] * 1000)),
+    )
+
+
+def _clamp16(value):
+    return max(0, min(65535, int(value)))
+
+# Applied to every connection. WAL + synchronous=NORMAL only fsyncs at
+# checkpoints, which is the main win on an SD card; a power cut can lose the
+# last few commits but never corrupts the database.
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-4000",      # 4 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def connect(db_path, readonly=False):
+    """Open a connection to the telemetry DB with the tuned pragmas applied."""
+    if readonly:
+        conn = sqlite3.connect("file:%s?mode=ro" % db_path, uri=True,
+                               check_same_thread=False)
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn = sqlite3.connect(db_path)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_db(db_path):
+    """
+    Create the tables/indexes (keeping any existing rows) and switch to WAL.
+
+    Incremental auto-vacuum is enabled so pruning can hand pages back to the
+    SD card; a database created without it is converted by a one-off VACUUM.
+    """
+    conn = connect(db_path)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA_SQL + PACKED_SCHEMA_SQL + VIEW_SQL + ROLLUP_SCHEMA_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# Output columns of a bucketed history query: avg (under the plain name)
+# plus min/max for the continuous series, duty cycle (0..1) for the flags.
+AGGREGATE_COLUMNS = (
+    "ts", "n",
+    "speed", "speed_min", "speed_max", "raw_speed",
+    "distance", "distance_min", "distance_max",
+    "line_l", "line_m", "line_r", "obstacle",
+    "cpu_temp", "cpu_temp_min", "cpu_temp_max",
+    "line_track", "avoid_obstacles", "color_follow", "color_detect", "face_detect",
+)
+
+
+def fetch_history(conn, cutoff, since=None):
+    """
+    Raw rows (TELEMETRY_COLUMNS order) with ts >= cutoff, oldest first.
+    With `since`, only rows strictly newer than that ts are returned.
+    """
+    c = conn.cursor()
+    c.execute("""
+        SELECT %s
+        FROM %s
+        WHERE ts >= ? AND ts > ?
+        ORDER BY ts ASC
+    """ % (", ".join(TELEMETRY_COLUMNS), RAW_SOURCE), (cutoff, since if since is not None else cutoff - 1))
+    return c.fetchall()
+
+
+def fetch_rows_after(conn, after, limit):
+    """
+    The `limit` oldest raw rows (TELEMETRY_COLUMNS order) with ts > after.
+    ORDER BY ... LIMIT on the view would sort everything newer than `after`
+    in a temp B-tree; each table answers from its ts index instead and the
+    two short lists are merged here.
+    """
+    rows = []
+    for select in RAW_SELECTS:
+        rows += conn.execute("%s WHERE ts > ? ORDER BY ts ASC LIMIT ?" % select,
+                             (after, limit)).fetchall()
+    rows.sort(key=lambda r: r[0])
+    return rows[:limit]
+
+
+# Raw rows → AGGREGATE_COLUMNS partials for buckets of :b seconds. Used both
+# for the per-minute rollup and for the not-yet-rolled-up tail of a query.
+RAW_AGGREGATE_SELECT = """
+    CAST(ts / :b AS INTEGER) * :b AS ts, COUNT(*) AS n,
+    AVG(speed) AS speed, MIN(speed) AS speed_min, MAX(speed) AS speed_max,
+    AVG(raw_speed) AS raw_speed,
+    AVG(distance) AS distance, MIN(distance) AS distance_min, MAX(distance) AS distance_max,
+    AVG(line_l) AS line_l, AVG(line_m) AS line_m, AVG(line_r) AS line_r,
+    AVG(obstacle) AS obstacle,
+    AVG(cpu_temp) AS cpu_temp, MIN(cpu_temp) AS cpu_temp_min, MAX(cpu_temp) AS cpu_temp_max,
+    AVG(line_track) AS line_track, AVG(avoid_obstacles) AS avoid_obstacles,
+    AVG(color_follow) AS color_follow, AVG(color_detect) AS color_detect,
+    AVG(face_detect) AS face_detect
+"""
+
+# Decimal places kept for averaged columns in API responses
+ROUND_DIGITS = {"line_l": 1, "line_m": 1, "line_r": 1, "obstacle": 3,
+                "line_track": 3, "avoid_obstacles": 3, "color_follow": 3,
+                "color_detect": 3, "face_detect": 3}
+
+
+def _merge_select(rounded=False):
+    """
+    Combine AGGREGATE_COLUMNS partials (raw buckets or rollup rows) into
+    coarser buckets of :b seconds: sample-weighted averages, min of mins,
+    max of maxes.
+    """
+    exprs = ["CAST(ts / :b AS INTEGER) * :b AS bucket_ts", "SUM(n)"]
+    for name in AGGREGATE_COLUMNS[2:]:
+        if name.endswith("_min"):
+            exprs.append("MIN(%s)" % name)
+        elif name.endswith("_max"):
+            exprs.append("MAX(%s)" % name)
+        elif rounded:
+            exprs.append("ROUND(SUM(%s * n) / SUM(n), %d)" % (name, ROUND_DIGITS.get(name, 2)))
+        else:
+            exprs.append("SUM(%s * n) / SUM(n)" % name)
+    return ", ".join(exprs)
+
+
+# Rollup tables, coarsest first: (table, bucket seconds)
+ROLLUP_TABLES = (("telemetry_1h", 3600), ("telemetry_1m", 60))
+
+ROLLUP_SCHEMA_SQL = "".join("""
+CREATE TABLE IF NOT EXISTS %s (
+  ts INTEGER PRIMARY KEY,
+  n INTEGER,
+  %s
+);
+""" % (table, ",\n  ".join("%s REAL" % c for c in AGGREGATE_COLUMNS[2:])) for table, _res in ROLLUP_TABLES)
+
+
+def align_bucket(bucket):
+    """
+    Round a requested bucket size up to a whole number of minutes/hours once
+    it is at least that coarse, so it can be served from a rollup table.
+    """
+    for _table, res in ROLLUP_TABLES:
+        if bucket >= res:
+            return float(math.ceil(bucket / res) * res)
+    return float(bucket)
+
+
+def rollup_high_water(conn, table, res):
+    """End (exclusive) of the data rolled up into `table`, or None if empty."""
+    hw = conn.execute("SELECT MAX(ts) FROM %s" % table).fetchone()[0]
+    return None if hw is None else hw + res
+
+
+def fetch_history_buckets(conn, cutoff, bucket, since=None):
+    """
+    Time-bucketed aggregates (AGGREGATE_COLUMNS order) computed by SQLite.
+
+    Buckets are aligned to multiples of `bucket` seconds since the epoch, so
+    consecutive polls see the same bucket boundaries; `ts` is the bucket start.
+    With `since` (a bucket start), that bucket and newer ones are returned;
+    the first one is re-sent because it may have grown since the last poll.
+
+    Minute/hour buckets are served from the rollup tables as far as they
+    reach, and only the newest, not yet rolled up part from raw rows.
+    """
+    if since is not None:
+        cutoff = max(cutoff, since)
+
+    parts = []
+    params = {"b": bucket}
+    start = math.floor(cutoff / bucket) * bucket    # first bucket complete
+    for i, (table, res) in enumerate(ROLLUP_TABLES):
+        if bucket < res or bucket % res:
+            continue
+        hw = rollup_high_water(conn, table, res)
+        if hw is None or hw <= start:
+            continue
+        parts.append("SELECT %s FROM %s WHERE ts >= :lo%d AND ts < :hi%d"
+                     % (", ".join(AGGREGATE_COLUMNS), table, i, i))
+        params["lo%d" % i] = start
+        params["hi%d" % i] = hw
+        start = hw
+    parts.append("SELECT %s FROM %s WHERE ts >= :raw_lo GROUP BY 1"
+                 % (RAW_AGGREGATE_SELECT, RAW_SOURCE))
+    params["raw_lo"] = start
+
+    c = conn.cursor()
+    c.execute("""
+        SELECT %s
+        FROM (%s)
+        GROUP BY bucket_ts
+        ORDER BY bucket_ts ASC
+    """ % (_merge_select(rounded=True), " UNION ALL ".join(parts)), params)
+    return c.fetchall()
+
+
+def rows_to_columns(names, rows):
+    """Transpose cursor rows into {column: [values...]} for ?format=columns."""
+    if not rows:
+        return {name: [] for name in names}
+    return dict(zip(names, map(list, zip(*rows))))
+
+
+class ReadPool:
+    """
+    Small pool of read-only connections shared by Flask request threads.
+
+    A connection is only ever used by one thread at a time; when all of them
+    are busy, `connection()` waits for one to be returned.
+    """
+
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect(self.db_path, readonly=True)
+            try:
+                yield conn
+            except sqlite3.DatabaseError:
+                conn.close()
+                raise
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TelemetryWriter:
+    """
+    Background SQLite writer fed by a bounded queue.
+
+    Rows are grouped into one `executemany` transaction whenever `batch_size`
+    rows are waiting or `flush_interval` seconds have passed since the first
+    waiting row, whichever comes first. `submit()` never blocks: when the
+    queue is full the row is dropped and counted instead. A batch that hits
+    a locked database (e.g. during maintenance) is kept and retried every
+    `retry_delay` seconds, with newer rows joining it, up to `max_queue`
+    rows.
+
+    With `compact` (the default) rows go to `telemetry_packed`, otherwise to
+    the wide `telemetry` table; reads see both through `telemetry_all`.
+    """
+
+    def __init__(self, db_path, batch_size=50, flush_interval=5.0,
+                 max_queue=2000, late_after=10.0, compact=True, retry_delay=1.0):
+        self.db_path = db_path
+        self.compact = compact                # write telemetry_packed rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.late_after = late_after          # seconds from sample to commit
+        self.max_queue = max_queue
+        self.retry_delay = retry_delay        # s between attempts while locked
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,       # queue full, row discarded by submit()
+            "late": 0,          # committed more than `late_after` s after ts
+            "failed": 0,        # lost in a failed transaction
+            "locked": 0,        # commits retried because the DB was locked
+            "batches": 0,
+            "max_batch": 0,
+            "max_commit_ms": 0.0,
+            "newest_ts": None,  # ts of the newest committed row
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, row):
+        """Queue one row dict for writing. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+            return False
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["queued"] = self._queue.qsize()
+        return s
+
+    def close(self, timeout=10.0):
+        """Stop the writer thread after flushing everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = connect(self.db_path)
+        batch = []
+        deadline = None
+        retrying = False
+        give_up = None
+        try:
+            while True:
+                timeout = 0.5 if deadline is None else max(0.0, deadline - time())
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                    if deadline is None:
+                        deadline = time() + self.flush_interval
+                except queue.Empty:
+                    pass
+
+                stopping = self._stop.is_set()
+                if stopping:
+                    if give_up is None:
+                        give_up = time() + self.retry_delay * 5
+                    # Drain whatever the control loop managed to queue
+                    while True:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+
+                due = bool(batch) and (stopping or time() >= deadline
+                                       or (not retrying and len(batch) >= self.batch_size))
+                if due:
+                    if self._write(conn, batch):
+                        batch = []
+                        deadline = None
+                        retrying = False
+                    else:
+                        # Locked: keep the rows and try again shortly
+                        overflow = len(batch) - self.max_queue
+                        if overflow > 0:
+                            del batch[:overflow]
+                            with self._stats_lock:
+                                self._stats["dropped"] += overflow
+                        deadline = time() + self.retry_delay
+                        retrying = True
+
+                if stopping and (not batch or time() >= give_up):
+                    if batch:
+                        with self._stats_lock:
+                            self._stats["failed"] += len(batch)
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        """Commit `batch`. Returns False if it should be retried (database locked)."""
+        t0 = time()
+        try:
+            with conn:
+                if self.compact:
+                    conn.executemany(PACKED_INSERT_SQL, [encode_row(r) for r in batch])
+                else:
+                    conn.executemany(INSERT_SQL, batch)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                return self._failed(batch, e)
+            with self._stats_lock:
+                self._stats["locked"] += 1
+            return False
+        except Exception as e:
+            return self._failed(batch, e)
+
+        done = time()
+        late = sum(1 for r in batch if done - r["ts"] > self.late_after)
+        with self._stats_lock:
+            self._stats["written"] += len(batch)
+            self._stats["late"] += late
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["max_commit_ms"] = max(self._stats["max_commit_ms"], (done - t0) * 1000.0)
+            self._stats["newest_ts"] = max(self._stats["newest_ts"] or 0.0, max(r["ts"] for r in batch))
+        return True
+
+    def _failed(self, batch, error):
+        print("DB insert error:", error)
+        with self._stats_lock:
+            self._stats["failed"] += len(batch)
+        sleep(0.5)
+        return True
+
+
+def _rollup(conn, table, res, source, end):
+    """
+    Aggregate complete `res`-second buckets before `end` from `source` (the
+    raw table or a finer rollup) into `table`, one day per transaction.
+    Returns the number of buckets written.
+    """
+    hw = rollup_high_water(conn, table, res)
+    if hw is None:
+        if source == RAW_SOURCE:
+            # MIN() over the view would scan it; ask each table instead
+            first = conn.execute("""
+                SELECT MIN(ts) FROM (SELECT MIN(ts) AS ts FROM telemetry
+                                     UNION ALL SELECT MIN(ts) FROM telemetry_packed)
+            """).fetchone()[0]
+        else:
+            first = conn.execute("SELECT MIN(ts) FROM %s" % source).fetchone()[0]
+        if first is None:
+            return 0
+        hw = int(first // res) * res
+
+    if source == RAW_SOURCE:
+        select = RAW_AGGREGATE_SELECT
+    else:
+        select = _merge_select()
+    sql = """
+        INSERT OR REPLACE INTO %s (%s)
+        SELECT %s FROM %s
+        WHERE ts >= :lo AND ts < :hi
+        GROUP BY 1
+    """ % (table, ", ".join(AGGREGATE_COLUMNS), select, source)
+
+    written = 0
+    while hw < end:
+        hi = min(end, hw + 86400)
+        with conn:
+            written += conn.execute(sql, {"b": res, "lo": hw, "hi": hi}).rowcount
+        hw = hi
+    return written
+
+
+# Pruning deletes and frees at most this many rows / pages per transaction,
+# pausing in between, so the writer never waits longer than busy_timeout
+PRUNE_CHUNK_ROWS = 5000
+VACUUM_CHUNK_PAGES = 500
+PRUNE_PAUSE = 0.05
+
+
+def _prune(conn, table, key, cutoff):
+    """Delete rows of `table` with ts < cutoff, PRUNE_CHUNK_ROWS per commit."""
+    sql = "DELETE FROM %s WHERE %s IN (SELECT %s FROM %s WHERE ts < ? LIMIT ?)" % (
+        table, key, key, table)
+    total = 0
+    while True:
+        with conn:
+            n = conn.execute(sql, (cutoff, PRUNE_CHUNK_ROWS)).rowcount
+        total += n
+        if n < PRUNE_CHUNK_ROWS:
+            return total
+        sleep(PRUNE_PAUSE)
+
+
+def _free_pages(conn):
+    """Hand free pages back to the file system, VACUUM_CHUNK_PAGES at a time."""
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    left = free
+    while left > 0:
+        # execute() would step the pragma once and free a single page
+        conn.executescript("PRAGMA incremental_vacuum(%d)" % VACUUM_CHUNK_PAGES)
+        remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if remaining >= left:
+            break
+        left = remaining
+        sleep(PRUNE_PAUSE)
+    return free
+
+
+def run_maintenance(conn, now, raw_retention, minute_retention, settle=120.0):
+    """
+    One maintenance pass: roll raw rows up into telemetry_1m and minutes into
+    telemetry_1h (complete buckets older than `settle` seconds only), prune
+    raw rows older than `raw_retention` and minutes older than
+    `minute_retention` once they are rolled up, then free the pages.
+    Hourly rollups are kept forever. Deletes and vacuuming run in small
+    chunks so a first pass over a large database does not lock out the
+    writer.
+    """
+    stats = {}
+    stats["rolled_1m"] = _rollup(conn, "telemetry_1m", 60, RAW_SOURCE,
+                                 int((now - settle) // 60) * 60)
+    hw_1m = rollup_high_water(conn, "telemetry_1m", 60)
+    stats["rolled_1h"] = _rollup(conn, "telemetry_1h", 3600, "telemetry_1m",
+                                 int((hw_1m or 0) // 3600) * 3600)
+    hw_1h = rollup_high_water(conn, "telemetry_1h", 3600)
+
+    raw_cutoff = min(now - raw_retention, hw_1m or 0)
+    stats["pruned_raw"] = (_prune(conn, "telemetry", "rowid", raw_cutoff)
+                           + _prune(conn, "telemetry_packed", "ts", raw_cutoff))
+    stats["pruned_1m"] = _prune(conn, "telemetry_1m", "ts",
+                                min(now - minute_retention, hw_1h or 0))
+
+    stats["freed_pages"] = _free_pages(conn)
+    return stats
+
+
+class TelemetryMaintenance:
+    """
+    Background thread running `run_maintenance()` every `interval` seconds
+    on its own connection.
+    """
+
+    def __init__(self, db_path, raw_retention=7 * 86400,
+                 minute_retention=90 * 86400, interval=300.0):
+        self.db_path = db_path
+        self.raw_retention = raw_retention
+        self.minute_retention = minute_retention
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._last = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="telemetry-maintenance", daemon=True)
+        self._thread.start()
+        return self
+
+    def stats(self):
+        return dict(self._last)
+
+    def close(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while True:
+                t0 = time()
+                try:
+                    result = run_maintenance(conn, t0, self.raw_retention, self.minute_retention)
+                    result["error"] = None
+                except Exception as e:
+                    print("DB maintenance error:", e)
+                    result = {"error": str(e)}
+                result["ts"] = t0
+                result["duration_ms"] = (time() - t0) * 1000.0
+                self._last = result
+                if self._stop.wait(self.interval):
+                    break
+        finally:
+            conn.close()
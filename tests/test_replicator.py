@@ -0,0 +1,162 @@
+"""Replicator against the SQLite stand-in for the central database."""
+import sqlite3
+from time import time
+
+import pytest
+
+from replicator import BatchRejected, Replicator, SqliteSink
+from telemetry_spool import Spool
+from telemetry_store import PACKED_INSERT_SQL, connect, encode_row, init_db
+
+ROWS = 3600
+START_TS = 1700000000.0
+
+
+def make_row(ts):
+    return {
+        "ts": ts, "speed": 40, "raw_speed": 45, "distance": 80,
+        "line_l": 100, "line_m": 900, "line_r": 120,
+        "motion": "forward", "line_state": "forward", "obstacle": 0, "cpu_temp": 51.25,
+        "line_track": 1, "avoid_obstacles": 0, "color_follow": 0,
+        "color_detect": 0, "face_detect": 0,
+    }
+
+
+class FlakySink(SqliteSink):
+    """Fails every `every`-th send before writing anything."""
+
+    def __init__(self, path, every=3):
+        super().__init__(path)
+        self.every = every
+        self.calls = 0
+
+    def send(self, rows):
+        self.calls += 1
+        if self.calls % self.every == 0:
+            raise ConnectionError("simulated outage")
+        return super().send(rows)
+
+
+@pytest.fixture
+def cart_db(tmp_path):
+    path = str(tmp_path / "telemetry.db")
+    init_db(path)
+    conn = connect(path)
+    with conn:
+        conn.executemany(PACKED_INSERT_SQL, [encode_row(make_row(START_TS + i)) for i in range(ROWS)])
+    conn.close()
+    return path
+
+
+def replicate_all(rep, conn, max_attempts=100):
+    """Drive replicate_once like Replicator._run does, retrying failed sends."""
+    high_water = rep.load_high_water(conn)
+    for _ in range(max_attempts):
+        try:
+            high_water, sent, _dups = rep.replicate_once(conn, high_water)
+        except ConnectionError:
+            continue
+        if sent < rep.batch_size:
+            return high_water
+    raise AssertionError("replication did not finish")
+
+
+def central_rows(path):
+    central = sqlite3.connect(path)
+    try:
+        return central.execute("SELECT vehicle_id, ts, cpu_temp FROM vehicle_telemetry ORDER BY ts").fetchall()
+    finally:
+        central.close()
+
+
+def test_flaky_sink_delivers_every_row_exactly_once(cart_db, tmp_path):
+    central_path = str(tmp_path / "central.db")
+    sink = FlakySink(central_path)
+    rep = Replicator(cart_db, "IntelliCart-01", sink, batch_size=500)
+    conn = connect(cart_db)
+    try:
+        assert replicate_all(rep, conn) == START_TS + ROWS - 1
+    finally:
+        conn.close()
+        sink.close()
+
+    rows = central_rows(central_path)
+    assert sink.calls > ROWS // 500    # some sends really failed
+    assert len(rows) == ROWS
+    assert [r[1] for r in rows] == [START_TS + i for i in range(ROWS)]
+    assert {r[0] for r in rows} == {"IntelliCart-01"}
+    assert rows[0][2] == pytest.approx(51.25)
+
+
+def test_resumes_from_saved_high_water_after_restart(cart_db, tmp_path):
+    central_path = str(tmp_path / "central.db")
+    conn = connect(cart_db)
+    try:
+        first = Replicator(cart_db, "IntelliCart-01", SqliteSink(central_path), batch_size=500)
+        first.replicate_once(conn, first.load_high_water(conn))
+        first.sink.close()
+
+        # A new instance (e.g. after a reboot) continues after the first batch
+        sink = SqliteSink(central_path)
+        second = Replicator(cart_db, "IntelliCart-01", sink, batch_size=500)
+        assert second.load_high_water(conn) == START_TS + 499
+        replicate_all(second, conn)
+        sink.close()
+    finally:
+        conn.close()
+
+    assert len(central_rows(central_path)) == ROWS
+
+
+class RejectingSink(SqliteSink):
+    """Refuses the batch containing `bad_ts`, like /api/ingest's 400."""
+
+    def __init__(self, path, bad_ts):
+        super().__init__(path)
+        self.bad_ts = bad_ts
+
+    def send(self, rows):
+        if any(r[0] == self.bad_ts for r in rows):
+            raise BatchRejected("HTTP 400: bad row")
+        return super().send(rows)
+
+
+def test_rejected_batch_is_skipped_not_retried(cart_db, tmp_path):
+    central_path = str(tmp_path / "central.db")
+    sink = RejectingSink(central_path, bad_ts=START_TS + 700)
+    rep = Replicator(cart_db, "IntelliCart-01", sink, batch_size=500)
+    conn = connect(cart_db)
+    try:
+        assert replicate_all(rep, conn, max_attempts=ROWS // 500 + 2) == START_TS + ROWS - 1
+    finally:
+        conn.close()
+        sink.close()
+
+    assert rep.stats()["rejected"] == 500
+    assert len(central_rows(central_path)) == ROWS - 500
+
+
+def test_only_rows_about_to_be_pruned_are_spooled(cart_db, tmp_path):
+    recent = [time() - 60 + i for i in range(50)]
+    conn = connect(cart_db)
+    with conn:
+        conn.executemany(PACKED_INSERT_SQL, [encode_row(make_row(ts)) for ts in recent])
+
+    spool = Spool(str(tmp_path / "spool"))
+    rep = Replicator(cart_db, "IntelliCart-01", SqliteSink(str(tmp_path / "central.db")),
+                     batch_size=500, spool=spool, spool_after=6 * 86400)
+    try:
+        # The sink is down: the old rows go to the spool, the recent ones stay put
+        high_water = rep.spool_pending(conn, rep.load_high_water(conn), time() - rep.spool_after)
+        assert high_water == START_TS + ROWS - 1
+        assert sum(len(spool.read(name)) for name in spool.segments()) == ROWS
+
+        # Back online: spool first, then the table from the high-water mark
+        assert rep.drain_spool() == (ROWS, 0)
+        assert not spool
+        assert replicate_all(rep, conn) == recent[-1]
+    finally:
+        conn.close()
+        rep.sink.close()
+
+    assert len(central_rows(str(tmp_path / "central.db"))) == ROWS + len(recent)
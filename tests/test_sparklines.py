@@ -0,0 +1,46 @@
+"""SparklineCache reuse, invalidation and bound."""
+import sparklines
+from sparklines import SparklineCache, render_svg
+
+
+class Renderer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return "svg%d" % self.calls
+
+
+def test_reused_until_newer_row_and_min_age(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(sparklines, "monotonic", lambda: clock[0])
+    cache, render = SparklineCache(min_age=10), Renderer()
+
+    assert cache.get("k", 1.0, render) == "svg1"
+    clock[0] += 60
+    assert cache.get("k", 1.0, render) == "svg1"   # no new data
+    assert cache.get("k", 2.0, render) == "svg2"   # new data, entry old enough
+    clock[0] += 5
+    assert cache.get("k", 3.0, render) == "svg2"   # new data, too young
+    assert cache.get("k", 3.0, render, min_age=2) == "svg2"
+    clock[0] += 6
+    assert cache.get("k", 3.0, render, min_age=30) == "svg2"
+    assert cache.get("k", 3.0, render) == "svg3"
+
+
+def test_oldest_entries_dropped():
+    cache, render = SparklineCache(min_age=10, max_entries=3), Renderer()
+    for key in "abcd":
+        cache.get(key, 1.0, render)
+    cache.get("b", 1.0, render)     # refreshes nothing, b stays cached
+    assert render.calls == 4
+    cache.get("a", 1.0, render)     # a was evicted
+    assert render.calls == 5
+
+
+def test_render_svg_breaks_line_at_gaps():
+    points = [(0, 1.0, 0.5, 1.5), (10, 2.0, 1.5, 2.5), (40, 3.0, 2.5, 3.5)]
+    svg = render_svg(points, 0, 60, 10, title="a<b")
+    assert svg.count("<polyline") == 1 and svg.count("<circle") == 1
+    assert "<title>a&lt;b</title>" in svg
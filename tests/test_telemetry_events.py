@@ -0,0 +1,45 @@
+"""EventDetector state across failed and re-sent batches."""
+from telemetry_events import EventDetector
+
+
+def row(ts, obstacle=0):
+    return {"vehicle_id": "cart-1", "ts": ts, "obstacle": obstacle, "distance": 12,
+            "line_l": 100, "line_m": 900, "line_r": 120, "cpu_temp": 50.0,
+            "line_track": 1, "avoid_obstacles": 0, "color_follow": 0,
+            "color_detect": 0, "face_detect": 0}
+
+
+def kinds(events):
+    return [(e[1], e[2]) for e in events]
+
+
+def test_resent_batch_is_detected_again():
+    det = EventDetector()
+    det.feed([row(1)])
+    batch = [row(2, obstacle=1), row(3, obstacle=1)]
+
+    events, _ = det.detect(batch)  # write failed: state never committed
+    assert kinds(events) == [(2, "obstacle_enter")]
+
+    events, pending = det.detect(batch)
+    assert kinds(events) == [(2, "obstacle_enter")]
+    det.commit(pending)
+
+    assert kinds(det.feed([row(4, obstacle=1), row(5)])) == [(5, "obstacle_exit")]
+
+
+def test_commit_never_moves_state_back():
+    det = EventDetector()
+    det.feed([row(1)])
+    _, older = det.detect([row(2, obstacle=1)])
+    _, newer = det.detect([row(2, obstacle=1), row(3)])
+    det.commit(newer)
+    det.commit(older)
+    assert kinds(det.feed([row(4, obstacle=1)])) == [(4, "obstacle_enter")]
+
+
+def test_late_batch_leaves_live_state_alone():
+    det = EventDetector()
+    det.feed([row(10, obstacle=1)])
+    assert kinds(det.feed([row(1), row(2, obstacle=1)])) == [(2, "obstacle_enter")]
+    assert kinds(det.feed([row(11)])) == [(11, "obstacle_exit")]
@@ -0,0 +1,101 @@
+"""Packed storage, bucketing, rollups and the batched writer."""
+import pytest
+
+from telemetry_store import (
+    AGGREGATE_COLUMNS, INSERT_SQL, PACKED_INSERT_SQL, RAW_SOURCE, TELEMETRY_COLUMNS,
+    TelemetryWriter, align_bucket, connect, encode_row, fetch_history,
+    fetch_history_buckets, init_db, run_maintenance,
+)
+
+START_TS = 1699999200.0     # on an hour boundary
+HOURS = 3
+
+
+def make_row(ts, **fields):
+    row = {
+        "ts": ts, "speed": 40, "raw_speed": 45, "distance": 80,
+        "line_l": 100, "line_m": 900, "line_r": 65535,
+        "motion": "left", "line_state": "right", "obstacle": 1, "cpu_temp": 51.234,
+        "line_track": 0, "avoid_obstacles": 1, "color_follow": 0,
+        "color_detect": 1, "face_detect": 0,
+    }
+    row.update(fields)
+    return row
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "telemetry.db")
+    init_db(path)
+    conn = connect(path)
+    yield path, conn
+    conn.close()
+
+
+def test_packed_row_reads_back_through_view(db):
+    _path, conn = db
+    row = make_row(START_TS)
+    with conn:
+        conn.execute(PACKED_INSERT_SQL, encode_row(row))
+    assert fetch_history(conn, START_TS - 1) == [tuple(row[c] for c in TELEMETRY_COLUMNS)]
+
+
+def test_view_merges_wide_and_packed_rows(db):
+    _path, conn = db
+    with conn:
+        conn.execute(INSERT_SQL, make_row(START_TS, cpu_temp=48.5))
+        conn.execute(PACKED_INSERT_SQL, encode_row(make_row(START_TS + 1, cpu_temp=49.125)))
+    rows = conn.execute("SELECT ts, cpu_temp FROM %s ORDER BY ts" % RAW_SOURCE).fetchall()
+    assert rows == [(START_TS, 48.5), (START_TS + 1, 49.125)]
+
+
+def test_align_bucket():
+    assert align_bucket(2.5) == 2.5
+    assert align_bucket(61) == 120.0
+    assert align_bucket(3601) == 7200.0
+
+
+def test_rollups_match_raw_buckets(db):
+    _path, conn = db
+    rows = [make_row(START_TS + i, speed=i % 100, obstacle=int(i % 4 == 0))
+            for i in range(HOURS * 3600)]
+    with conn:
+        conn.executemany(PACKED_INSERT_SQL, [encode_row(r) for r in rows])
+    raw = {b: fetch_history_buckets(conn, START_TS, b) for b in (60, 3600)}
+
+    stats = run_maintenance(conn, START_TS + HOURS * 3600 + 600,
+                            raw_retention=86400, minute_retention=86400 * 90)
+    assert stats["rolled_1m"] == HOURS * 60
+    assert stats["rolled_1h"] == HOURS
+    assert stats["pruned_raw"] == 0
+
+    for bucket, expected in raw.items():
+        got = fetch_history_buckets(conn, START_TS, bucket)
+        assert got == expected
+    hour = dict(zip(AGGREGATE_COLUMNS, raw[3600][0]))
+    assert hour["n"] == 3600
+    assert hour["speed_min"] == 0 and hour["speed_max"] == 99
+    assert hour["obstacle"] == 0.25
+
+
+def test_maintenance_prunes_rolled_up_raw_rows(db):
+    _path, conn = db
+    with conn:
+        conn.executemany(PACKED_INSERT_SQL, [encode_row(make_row(START_TS + i)) for i in range(7200)])
+    now = START_TS + 7200 + 86400
+    stats = run_maintenance(conn, now, raw_retention=86400 + 3600, minute_retention=86400 * 90)
+    assert stats["pruned_raw"] == 3600
+    assert conn.execute("SELECT MIN(ts) FROM telemetry_packed").fetchone()[0] == START_TS + 3600
+    assert fetch_history_buckets(conn, START_TS, 3600)[0][1] == 3600
+
+
+def test_writer_commits_every_submitted_row(db):
+    path, conn = db
+    writer = TelemetryWriter(path, batch_size=20, flush_interval=0.1).start()
+    for i in range(55):
+        writer.submit(make_row(START_TS + i))
+    writer.close()
+    stats = writer.stats()
+    assert stats["written"] == 55 and stats["failed"] == 0 and stats["dropped"] == 0
+    assert stats["newest_ts"] == START_TS + 54
+    assert conn.execute("SELECT COUNT(*) FROM telemetry_packed").fetchone()[0] == 55